@@ -0,0 +1,54 @@
+import resource
+
+from django.conf import settings
+
+from .db.bulk import restore_deferred_indexes
+from .engine import export_snapshot
+from .models import (clear_corpus, import_data, mark_core,
+                     update_corpus_stats, update_edition_lemmas,
+                     update_edition_token_counts, update_lemma_counts,
+                     update_sections, update_shortdefs)
+
+
+def corpus_stages(options):
+    """
+    The stages of a corpus build, in order, as (name, callable) pairs.
+    Each callable returns the number of rows it wrote.
+    """
+
+    def load():
+        clear_corpus()
+        # put back anything dropped by a load that was killed, now that the
+        # tables are empty and it is cheap to rebuild
+        restore_deferred_indexes(workers=max(options["workers"], 2))
+        return import_data(
+            options["edition_filename"],
+            options["dictionary_filename"],
+            options["passage_lemmas_filename"],
+            options["source"],
+            batch_size=options["batch_size"],
+            workers=options["workers"],
+            defer_indexes=not options["keep_indexes"],
+        )
+
+    return [
+        ("import_data", load),
+        ("update_shortdefs", update_shortdefs),
+        ("update_edition_lemmas", update_edition_lemmas),
+        ("update_sections", update_sections),
+        ("mark_core", lambda: mark_core(options["core_filename"])),
+        ("update_lemma_counts", update_lemma_counts),
+        ("update_edition_token_counts", update_edition_token_counts),
+        ("update_corpus_stats", update_corpus_stats),
+        ("export_snapshot", lambda: export_snapshot(settings.CORPUS_SNAPSHOT)),
+    ]
+
+
+def peak_rss():
+    """
+    Peak resident set size in MB of this process and of the largest child
+    process (such as an import worker) so far.
+    """
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return own / 1024, children / 1024
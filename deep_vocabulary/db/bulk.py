@@ -0,0 +1,200 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from io import StringIO
+
+from django.db import connection, transaction
+
+
+logger = logging.getLogger(__name__)
+
+
+class CopyWriter:
+    """
+    Buffers rows destined for `table` and COPYs them into Postgres every
+    `batch_size` rows, so memory use is bounded by the batch rather than by
+    the total number of rows written.
+
+    Writers in `depends_on` (for example one loading a table this one has
+    foreign keys into) are flushed before each batch of this writer.
+    """
+
+    def __init__(self, cursor, table, columns, batch_size=100000, depends_on=()):
+        self.cursor = cursor
+        self.table = table
+        self.columns = columns
+        self.batch_size = batch_size
+        self.depends_on = depends_on
+        self.buf = StringIO()
+        self.pending = 0
+        self.count = 0
+        self.started = time.time()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def write(self, row):
+        self.buf.write("\t".join([str(v) for v in row]) + "\n")
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        for writer in self.depends_on:
+            writer.flush()
+        if not self.pending:
+            return
+        self.buf.seek(0)
+        self.cursor.copy_from(self.buf, self.table, columns=self.columns)
+        self.count += self.pending
+        self.pending = 0
+        self.buf = StringIO()
+        elapsed = time.time() - self.started
+        if elapsed > 0:
+            logger.info("%s: %d rows (%.0f rows/sec)", self.table, self.count, self.count / elapsed)
+        else:
+            logger.info("%s: %d rows", self.table, self.count)
+
+
+def copy_rows(cursor, table, columns, rows, batch_size=100000):
+    """
+    COPY an iterable of row tuples into `table` in fixed-size batches.
+
+    `rows` is consumed lazily, so a generator is only advanced as fast as
+    Postgres accepts each batch.
+    """
+    with CopyWriter(cursor, table, columns, batch_size=batch_size) as writer:
+        for row in rows:
+            writer.write(row)
+    return writer.count
+
+
+def sequence_ids(cursor, table, block_size=10000):
+    """
+    Yield new ids from the serial sequence of `table`, reserving them in
+    blocks so rows can be given their primary keys before they are COPYed.
+    Concurrent callers never receive the same id.
+    """
+    while True:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+            [table, block_size],
+        )
+        yield from (pk for pk, in cursor.fetchall())
+
+
+def _execute(sql):
+    # runs in its own thread, and so over its own connection
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+    finally:
+        connection.close()
+
+
+def analyze(*tables):
+    with connection.cursor() as cursor:
+        for table in tables:
+            cursor.execute(f"ANALYZE {table}")
+
+
+def restore_deferred_indexes(workers=4):
+    """
+    Recreate the indexes (in parallel) and then the foreign keys recorded as
+    DeferredIndex rows, forgetting each once it exists again. Returns the
+    number restored; any left over from a load that was killed are
+    restored by the next call.
+    """
+    # models imports this module
+    from ..models import DeferredIndex
+
+    with connection.cursor() as cursor:
+        # one that was recreated just before a load was killed is already back
+        cursor.execute("""
+            SELECT name FROM deep_vocabulary_deferredindex
+            WHERE (NOT is_foreign_key AND to_regclass(name) IS NOT NULL)
+                OR (is_foreign_key AND EXISTS (
+                    SELECT 1 FROM pg_constraint
+                    WHERE conname = name AND conrelid = to_regclass("table")
+                ))
+        """)
+        DeferredIndex.objects.filter(name__in=[name for name, in cursor.fetchall()]).delete()
+    pending = list(DeferredIndex.objects.order_by("pk"))
+    if not pending:
+        return 0
+    started = time.time()
+    indexes = [index for index in pending if not index.is_foreign_key]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(_execute, [index.definition for index in indexes]))
+    DeferredIndex.objects.filter(pk__in=[index.pk for index in indexes]).delete()
+    with connection.cursor() as cursor:
+        for foreign_key in pending:
+            if foreign_key.is_foreign_key:
+                cursor.execute(
+                    f"ALTER TABLE {foreign_key.table} ADD CONSTRAINT {foreign_key.name} {foreign_key.definition}"
+                )
+                foreign_key.delete()
+    logger.info(
+        "rebuilt %d indexes and %d foreign keys in %.2fs",
+        len(indexes), len(pending) - len(indexes), time.time() - started,
+    )
+    return len(pending)
+
+
+@contextmanager
+def deferred_indexes(*tables, workers=4):
+    """
+    Drop the secondary (non-unique) indexes and foreign keys on `tables`
+    for the duration of a bulk load, then rebuild the indexes in parallel,
+    restore the foreign keys and ANALYZE the tables.
+
+    The dropped definitions are recorded as DeferredIndex rows in the same
+    transaction as the drops, so if the load is killed they are restored
+    by the next load or by `restore_deferred_indexes`. If the load fails
+    they are restored before its error is raised, and a failure restoring
+    them is logged rather than raised in its place.
+    """
+    from ..models import DeferredIndex
+
+    restore_deferred_indexes(workers=workers)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT indrelid::regclass::text, indexrelid::regclass::text, pg_get_indexdef(indexrelid)
+            FROM pg_index
+            WHERE indrelid = ANY(%s::regclass[])
+                AND NOT indisprimary AND NOT indisunique
+        """, [list(tables)])
+        indexes = cursor.fetchall()
+        cursor.execute("""
+            SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid)
+            FROM pg_constraint
+            WHERE contype = 'f' AND conrelid = ANY(%s::regclass[])
+        """, [list(tables)])
+        foreign_keys = cursor.fetchall()
+        DeferredIndex.objects.bulk_create(
+            [DeferredIndex(table=table, name=name, definition=definition) for table, name, definition in indexes] +
+            [
+                DeferredIndex(table=table, name=name, definition=definition, is_foreign_key=True)
+                for table, name, definition in foreign_keys
+            ]
+        )
+        for table, name, _ in foreign_keys:
+            cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {name}")
+        for _, name, _ in indexes:
+            cursor.execute(f"DROP INDEX {name}")
+    logger.info("dropped %d indexes and %d foreign keys", len(indexes), len(foreign_keys))
+    try:
+        yield
+    except BaseException:
+        try:
+            restore_deferred_indexes(workers=workers)
+        except Exception:
+            logger.exception("could not restore the dropped indexes; the next load will restore them")
+        raise
+    restore_deferred_indexes(workers=workers)
+    analyze(*tables)
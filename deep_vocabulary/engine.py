@@ -0,0 +1,485 @@
+import os
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from io import StringIO
+
+import numpy as np
+
+from django.conf import settings
+from django.db import connection
+
+from .models import Lemma, LemmaShortdef, Passage, TextEdition, current_corpus_stats
+from .snapshot import Snapshot, StringColumn, write_snapshot
+from .utils import AFTER_ALL, ref_range_keys
+
+
+# passages between the cumulative count checkpoints of a PassageIndex, and
+# the most checkpoint cells (checkpoints × lemmas, 4 bytes each) an edition
+# may have before the interval is widened to fit
+CHECKPOINT_INTERVAL = 128
+CHECKPOINT_CELLS = 1024 * 1024
+
+
+def _copy_array(cursor, query, columns, params=()):
+    # COPY is far quicker than fetching rows as Python tuples, and numpy
+    # parses its tab and newline separated output directly
+    buf = StringIO()
+    query = cursor.mogrify(query, params).decode()
+    cursor.copy_expert(f"COPY ({query}) TO STDOUT", buf)
+    return np.fromstring(buf.getvalue(), dtype=np.int64, sep=" ").reshape(-1, columns)
+
+
+class CorpusMatrix:
+    """
+    The editions × lemmas count matrix (the EditionLemma table) held in
+    memory in compressed sparse row form, with the per-lemma corpus and
+    core counts and per-edition token counts alongside.
+
+    Rows and columns are positions in the sorted `edition_ids` and
+    `lemma_ids` arrays. Row `i` holds columns `indices[indptr[i]:indptr[i + 1]]`
+    with counts `counts[indptr[i]:indptr[i + 1]]`.
+
+    `sort_ranks` gives the position of each lemma in sort key order. A
+    matrix read from a snapshot also has the lemma texts, sort keys and
+    shortdefs from each of the DEFINITION_SOURCES, through `snapshot`.
+    """
+
+    def __init__(self, version, edition_ids, token_counts, lemma_ids, corpus_counts,
+                 core_counts, sort_ranks, indptr, indices, counts, snapshot=None):
+        self.version = version
+        self.snapshot = snapshot
+        self.sort_ranks = sort_ranks
+        self.edition_ids = edition_ids
+        self.token_counts = token_counts
+        self.lemma_ids = lemma_ids
+        self.corpus_counts = corpus_counts
+        self.core_counts = core_counts
+        self.indptr = indptr
+        self.indices = indices
+        self.counts = counts
+        self._columns = None
+
+    @classmethod
+    def from_database(cls, version):
+        with connection.cursor() as cursor:
+            editions = _copy_array(cursor, """
+                SELECT id, token_count FROM deep_vocabulary_textedition ORDER BY id
+            """, 2)
+            lemmas = _copy_array(cursor, """
+                SELECT id, corpus_count, core_count FROM deep_vocabulary_lemma ORDER BY id
+            """, 3)
+            cells = _copy_array(cursor, """
+                SELECT text_edition_id, lemma_id, count
+                FROM deep_vocabulary_editionlemma
+                ORDER BY text_edition_id, lemma_id
+            """, 3)
+            sorted_ids = _copy_array(cursor, """
+                SELECT id FROM deep_vocabulary_lemma ORDER BY sort_key COLLATE "C", id
+            """, 1)
+        edition_ids = editions[:, 0].astype(np.int32)
+        lemma_ids = lemmas[:, 0].astype(np.int32)
+        sort_ranks = np.empty(len(lemma_ids), dtype=np.int32)
+        sort_ranks[np.searchsorted(lemma_ids, sorted_ids[:, 0])] = np.arange(len(lemma_ids))
+        rows = np.searchsorted(edition_ids, cells[:, 0])
+        indptr = np.zeros(len(edition_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(edition_ids)), out=indptr[1:])
+        return cls(
+            version,
+            edition_ids,
+            editions[:, 1],
+            lemma_ids,
+            lemmas[:, 1],
+            lemmas[:, 2],
+            sort_ranks,
+            indptr,
+            np.searchsorted(lemma_ids, cells[:, 1]).astype(np.int32),
+            cells[:, 2].astype(np.int32),
+        )
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        return cls(
+            snapshot.version,
+            snapshot.array("edition_ids"),
+            snapshot.array("edition_token_counts"),
+            snapshot.array("lemma_ids"),
+            snapshot.array("lemma_corpus_counts"),
+            snapshot.array("lemma_core_counts"),
+            snapshot.array("lemma_sort_ranks"),
+            snapshot.array("matrix_indptr"),
+            snapshot.array("matrix_indices"),
+            snapshot.array("matrix_counts"),
+            snapshot=snapshot,
+        )
+
+    def edition_row(self, edition_id):
+        """
+        The (column positions, counts) of the lemmas in an edition.
+        """
+        row = np.searchsorted(self.edition_ids, edition_id)
+        if row == len(self.edition_ids) or self.edition_ids[row] != edition_id:
+            return self.indices[:0], self.counts[:0]
+        start, end = self.indptr[row], self.indptr[row + 1]
+        return self.indices[start:end], self.counts[start:end]
+
+    def lemma_column(self, lemma_id):
+        """
+        The (edition ids, counts) of the editions a lemma occurs in.
+        """
+        if self._columns is None:
+            # a transposed copy (sorted by column) built on first use
+            order = np.argsort(self.indices, kind="stable")
+            rows = np.repeat(np.arange(len(self.edition_ids)), np.diff(self.indptr))
+            colptr = np.zeros(len(self.lemma_ids) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.indices, minlength=len(self.lemma_ids)), out=colptr[1:])
+            self._columns = colptr, rows[order].astype(np.int32), self.counts[order]
+        colptr, rows, counts = self._columns
+        column = np.searchsorted(self.lemma_ids, lemma_id)
+        if column == len(self.lemma_ids) or self.lemma_ids[column] != lemma_id:
+            return self.edition_ids[:0], self.counts[:0]
+        start, end = colptr[column], colptr[column + 1]
+        return self.edition_ids[rows[start:end]], counts[start:end]
+
+
+class PassageIndex:
+    """
+    The passages × lemmas count matrix of one edition in compressed sparse
+    row form, rows in passage (ordinal) order, with the cumulative count of
+    every lemma stored at every `interval` passages.
+
+    The counts over any run of passages are then the difference of two
+    prefix sums, each a checkpoint plus fewer than `interval` rows, so the
+    cost barely depends on the length of the run.
+
+    `keys` are the passages' references encoded by passage_key, in a
+    StringColumn whether built from the database or read from a snapshot,
+    so they can be binary searched and their size counted.
+    """
+
+    def __init__(self, keys, lemma_ids, indptr, indices, counts, interval=None, checkpoints=None):
+        self.keys = keys
+        self.lemma_ids = lemma_ids
+        self.indptr = indptr
+        self.indices = indices
+        self.counts = counts
+        if checkpoints is None:
+            interval, checkpoints = passage_checkpoints(indptr, indices, counts, len(lemma_ids))
+        self.interval = interval
+        self.checkpoints = checkpoints
+
+    @property
+    def nbytes(self):
+        return sum(
+            array.nbytes
+            for array in [
+                self.keys.offsets, self.keys.blob,
+                self.lemma_ids, self.indptr, self.indices, self.counts, self.checkpoints,
+            ]
+        )
+
+    @classmethod
+    def from_database(cls, text_edition_id):
+        keys = StringColumn(*StringColumn.encode([
+            passage_key(refs)
+            for refs in Passage.objects.filter(
+                text_edition_id=text_edition_id,
+            ).order_by("ordinal").values_list("ref1", "ref2", "ref3", "ref4")
+        ]))
+        with connection.cursor() as cursor:
+            cells = _copy_array(cursor, """
+                SELECT p.ordinal, pl.lemma_id, pl.count
+                FROM deep_vocabulary_passagelemma pl
+                JOIN deep_vocabulary_passage p ON p.id = pl.passage_id
+                WHERE pl.text_edition_id = %s
+                ORDER BY p.ordinal
+            """, 3, [text_edition_id])
+        lemma_ids, indices = np.unique(cells[:, 1], return_inverse=True)
+        indptr = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cells[:, 0] - 1, minlength=len(keys)), out=indptr[1:])
+        return cls(keys, lemma_ids, indptr, indices.astype(np.int32), cells[:, 2].astype(np.int32))
+
+    @classmethod
+    def from_snapshot(cls, snapshot, text_edition_id):
+        """
+        The index of an edition mapped from the snapshot, keys, counts and
+        checkpoints alike, with nothing to compute.
+        """
+        edition_ids = snapshot.array("edition_ids")
+        row = np.searchsorted(edition_ids, text_edition_id)
+        if row == len(edition_ids) or edition_ids[row] != text_edition_id:
+            return cls(
+                StringColumn(*StringColumn.encode([])),
+                np.zeros(0, dtype=np.int32), np.zeros(1, dtype=np.int64),
+                np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32),
+            )
+        first, last = snapshot.array("edition_passages")[row:row + 2]
+        keys = snapshot.strings("passage_keys")
+        indptr = snapshot.array("passage_indptr")[first:last + 1]
+        start, end = indptr[0], indptr[-1]
+        lemmas_start, lemmas_end = snapshot.array("edition_lemmas")[row:row + 2]
+        lemma_ids = snapshot.array("edition_lemma_ids")[lemmas_start:lemmas_end]
+        interval = int(snapshot.array("edition_checkpoint_intervals")[row])
+        cells_start, cells_end = snapshot.array("edition_checkpoints")[row:row + 2]
+        return cls(
+            StringColumn(keys.offsets[first:last + 1], keys.blob),
+            lemma_ids,
+            indptr - start,
+            snapshot.array("passage_indices")[start:end],
+            snapshot.array("passage_counts")[start:end],
+            interval=interval,
+            # the shape passage_checkpoints gives, which holds for an edition
+            # without passages or lemmas too
+            checkpoints=snapshot.array("passage_checkpoints")[cells_start:cells_end].reshape(
+                (last - first) // interval + 2, len(lemma_ids),
+            ),
+        )
+
+    def ordinal_range(self, ref):
+        """
+        The (first, last) ordinals of the passages covered by `ref`, like
+        PassageQuerySet.ordinal_range but by binary search on the references.
+        """
+        keys = ref_range_keys(ref)
+        if keys is None:
+            return None
+        start, end = (passage_key(key) for key in keys)
+        # the first passage at or after `start`, and the last before any
+        # key greater than `end` and those of the passages under it
+        first = bisect_left(self.keys, start)
+        last = bisect_left(self.keys, end + AFTER_ALL) - 1
+        if first > last:
+            return None
+        return first + 1, last + 1
+
+    def prefix_counts(self, n):
+        """
+        The count of every lemma over the first `n` passages.
+        """
+        checkpoint = n // self.interval
+        totals = self.checkpoints[checkpoint].copy()
+        start, end = self.indptr[checkpoint * self.interval], self.indptr[n]
+        np.add.at(totals, self.indices[start:end], self.counts[start:end])
+        return totals
+
+    def range_counts(self, first, last):
+        """
+        The (lemma ids, counts) over the passages with ordinals `first` to
+        `last`.
+        """
+        totals = self.prefix_counts(last) - self.prefix_counts(first - 1)
+        present = np.flatnonzero(totals)
+        return self.lemma_ids[present], totals[present]
+
+
+def passage_key(refs):
+    """
+    A passage's reference levels (as natural_sort_key gives them) as one
+    string that sorts like the levels do: each component is followed by
+    \x02 and each level by \x01, which sort before any character of a
+    reference. The key of a partial reference is a prefix of the keys of
+    the passages under it.
+    """
+    return "".join(
+        "".join(f"{component}\x02" for component in level) + "\x01"
+        for level in refs
+    )
+
+
+def passage_checkpoints(indptr, indices, counts, columns):
+    """
+    The (interval, checkpoints) of a PassageIndex: the cumulative counts of
+    the `columns` lemmas before every `interval` passages, the interval
+    widened if need be to keep within CHECKPOINT_CELLS.
+    """
+    passages = len(indptr) - 1
+    interval = max(CHECKPOINT_INTERVAL, -(-passages * columns // CHECKPOINT_CELLS))
+    rows = np.repeat(np.arange(passages), np.diff(indptr))
+    checkpoints = np.zeros((passages // interval + 2, columns), dtype=np.int32)
+    np.add.at(checkpoints, (rows // interval + 1, indices), counts)
+    return interval, np.cumsum(checkpoints, axis=0, dtype=np.int32)
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+_matrix = None
+_matrix_lock = threading.Lock()
+_passage_indexes = OrderedDict()
+_passage_indexes_bytes = 0
+_passage_indexes_lock = threading.Lock()
+
+
+def use_matrix():
+    return settings.VOCABULARY_ENGINE == "memory"
+
+
+def current_snapshot():
+    """
+    The snapshot at CORPUS_SNAPSHOT if it was exported from the current
+    corpus version, mapped on first use and remapped whenever
+    export_snapshot replaces the file. None if there is no such snapshot.
+    """
+    global _snapshot
+    try:
+        stat = os.stat(settings.CORPUS_SNAPSHOT)
+    except (TypeError, FileNotFoundError):
+        return None
+    with _snapshot_lock:
+        if _snapshot is None or _snapshot.identity != (stat.st_ino, stat.st_mtime_ns):
+            try:
+                _snapshot = Snapshot(settings.CORPUS_SNAPSHOT)
+            except ValueError:
+                # written by an older version of export_snapshot
+                return None
+        snapshot = _snapshot
+    if snapshot.version != current_corpus_stats().version:
+        return None
+    return snapshot
+
+
+def corpus_matrix():
+    """
+    The CorpusMatrix of the current corpus version, mapped from the
+    snapshot if there is one and otherwise loaded from the database into
+    this process, on first use and again once a rebuild changes the version.
+    """
+    global _matrix
+    version = current_corpus_stats().version
+    snapshot = current_snapshot()
+    with _matrix_lock:
+        if _matrix is None or _matrix.version != version or _matrix.snapshot is not snapshot:
+            if snapshot:
+                _matrix = CorpusMatrix.from_snapshot(snapshot)
+            else:
+                _matrix = CorpusMatrix.from_database(version)
+        return _matrix
+
+
+def passage_index(text_edition_id):
+    """
+    The PassageIndex of an edition for the current corpus version, built
+    on first use. The most recently used indexes are kept, up to
+    PASSAGE_INDEX_CACHE_MAX_BYTES of them.
+    """
+    global _passage_indexes_bytes
+    key = (current_corpus_stats().version, text_edition_id)
+    with _passage_indexes_lock:
+        if key in _passage_indexes:
+            _passage_indexes.move_to_end(key)
+            return _passage_indexes[key]
+    snapshot = current_snapshot()
+    if snapshot:
+        index = PassageIndex.from_snapshot(snapshot, text_edition_id)
+    else:
+        index = PassageIndex.from_database(text_edition_id)
+    if index.nbytes > settings.PASSAGE_INDEX_CACHE_MAX_BYTES:
+        return index
+    with _passage_indexes_lock:
+        if key not in _passage_indexes:
+            _passage_indexes[key] = index
+            _passage_indexes_bytes += index.nbytes
+        while _passage_indexes_bytes > settings.PASSAGE_INDEX_CACHE_MAX_BYTES:
+            _, evicted = _passage_indexes.popitem(last=False)
+            _passage_indexes_bytes -= evicted.nbytes
+    return index
+
+
+def export_snapshot(path):
+    """
+    Write the corpus matrix, the passage counts of every edition and the
+    lemma and edition metadata of the current corpus version to a snapshot
+    file at `path`, atomically replacing any snapshot already there.
+    Return the number of passage lemma counts written.
+    """
+    version = current_corpus_stats().version
+    matrix = CorpusMatrix.from_database(version)
+    with connection.cursor() as cursor:
+        cells = _copy_array(cursor, """
+            SELECT p.text_edition_id, p.ordinal, pl.lemma_id, pl.count
+            FROM deep_vocabulary_passagelemma pl
+            JOIN deep_vocabulary_passage p ON p.id = pl.passage_id
+            ORDER BY p.text_edition_id, p.ordinal
+        """, 4)
+    passages = list(
+        Passage.objects.order_by("text_edition_id", "ordinal").values_list(
+            "text_edition_id", "ref1", "ref2", "ref3", "ref4",
+        )
+    )
+
+    # passages of edition row i are rows edition_passages[i] to edition_passages[i + 1]
+    edition_passages = np.zeros(len(matrix.edition_ids) + 1, dtype=np.int64)
+    np.cumsum(
+        np.bincount(
+            np.searchsorted(matrix.edition_ids, [text_edition_id for text_edition_id, *_ in passages]),
+            minlength=len(matrix.edition_ids),
+        ),
+        out=edition_passages[1:],
+    )
+    passage_rows = edition_passages[np.searchsorted(matrix.edition_ids, cells[:, 0])] + cells[:, 1] - 1
+    passage_indptr = np.zeros(len(passages) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(passage_rows, minlength=len(passages)), out=passage_indptr[1:])
+
+    # each edition's passage counts index their own sorted lemma ids, and
+    # come with the PassageIndex checkpoints over them
+    passage_indices = np.zeros(len(cells), dtype=np.int32)
+    edition_lemma_ids = []
+    edition_lemmas = np.zeros(len(matrix.edition_ids) + 1, dtype=np.int64)
+    intervals = np.zeros(len(matrix.edition_ids), dtype=np.int32)
+    checkpoints = []
+    edition_checkpoints = np.zeros(len(matrix.edition_ids) + 1, dtype=np.int64)
+    for row in range(len(matrix.edition_ids)):
+        first, last = edition_passages[row:row + 2]
+        indptr = passage_indptr[first:last + 1]
+        start, end = indptr[0], indptr[-1]
+        lemma_ids, indices = np.unique(cells[start:end, 2], return_inverse=True)
+        passage_indices[start:end] = indices
+        intervals[row], edition_checkpoint_counts = passage_checkpoints(
+            indptr - start, indices, cells[start:end, 3], len(lemma_ids),
+        )
+        edition_lemma_ids.append(lemma_ids.astype(np.int32))
+        edition_lemmas[row + 1] = edition_lemmas[row] + len(lemma_ids)
+        checkpoints.append(edition_checkpoint_counts.ravel())
+        edition_checkpoints[row + 1] = edition_checkpoints[row] + edition_checkpoint_counts.size
+
+    texts = list(Lemma.objects.order_by("id").values_list("text", "sort_key"))
+    shortdefs = {source: {} for source in settings.DEFINITION_SOURCES}
+    for lemma_id, source, shortdef in LemmaShortdef.objects.values_list("lemma_id", "source", "shortdef"):
+        shortdefs[source][lemma_id] = shortdef
+    write_snapshot(
+        path,
+        version,
+        {
+            "edition_ids": matrix.edition_ids,
+            "edition_token_counts": matrix.token_counts,
+            "edition_is_core": np.array(
+                list(TextEdition.objects.order_by("id").values_list("is_core", flat=True)), dtype=np.uint8,
+            ),
+            "lemma_ids": matrix.lemma_ids,
+            "lemma_corpus_counts": matrix.corpus_counts,
+            "lemma_core_counts": matrix.core_counts,
+            "lemma_sort_ranks": matrix.sort_ranks,
+            "matrix_indptr": matrix.indptr,
+            "matrix_indices": matrix.indices,
+            "matrix_counts": matrix.counts,
+            "edition_passages": edition_passages,
+            "passage_indptr": passage_indptr,
+            "passage_indices": passage_indices,
+            "passage_counts": cells[:, 3].astype(np.int32),
+            "edition_lemmas": edition_lemmas,
+            "edition_lemma_ids": np.concatenate([np.zeros(0, dtype=np.int32)] + edition_lemma_ids),
+            "edition_checkpoint_intervals": intervals,
+            "edition_checkpoints": edition_checkpoints,
+            "passage_checkpoints": np.concatenate([np.zeros(0, dtype=np.int32)] + checkpoints),
+        },
+        {
+            "edition_urns": TextEdition.objects.order_by("id").values_list("cts_urn", flat=True),
+            "lemma_texts": [text for text, _ in texts],
+            "lemma_sort_keys": [sort_key for _, sort_key in texts],
+            "passage_keys": [passage_key(refs) for _, *refs in passages],
+            **{
+                f"lemma_shortdefs.{source}": [source_shortdefs.get(pk) for pk in matrix.lemma_ids.tolist()]
+                for source, source_shortdefs in shortdefs.items()
+            },
+        },
+    )
+    return len(cells)
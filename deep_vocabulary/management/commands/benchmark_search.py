@@ -0,0 +1,75 @@
+import re
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from deep_vocabulary.search import lemma_index, search_lemmas
+
+
+DEFAULT_QUERIES = ["αγ*", "*ος", "*μαι", "love", "war", "λογος"]
+
+
+class Command(BaseCommand):
+
+    help = "Time lemma list searches and show which scan the planner uses for each"
+
+    def add_arguments(self, parser):
+        parser.add_argument("queries", nargs="*", help=f"searches to time (default: {' '.join(DEFAULT_QUERIES)})")
+        parser.add_argument("--repeat", type=int, default=20, help="timed runs per search")
+        parser.add_argument(
+            "--autocomplete", action="store_true",
+            help="time the in-memory index behind lemma autocomplete instead",
+        )
+        parser.add_argument("--fuzzy", action="store_true", help="time fuzzy searches of the in-memory index instead")
+
+    def handle(self, *args, **options):
+        if options["autocomplete"] or options["fuzzy"]:
+            started = time.perf_counter()
+            index = lemma_index()
+            self.stdout.write(f"built lemma index in {(time.perf_counter() - started) * 1000:.0f}ms")
+        if options["fuzzy"]:
+            started = time.perf_counter()
+            index.bigram_index()
+            self.stdout.write(f"built bigram index in {(time.perf_counter() - started) * 1000:.0f}ms")
+        for query in options["queries"] or DEFAULT_QUERIES:
+            if options["fuzzy"]:
+                count = len(index.fuzzy(query))
+                summary = self.time(lambda: index.fuzzy(query), options["repeat"])
+                self.stdout.write(f"{query:<12} {count:>7} lemmas  {summary}")
+            elif options["autocomplete"]:
+                count = len(index.complete(query))
+                summary = self.time(lambda: index.rows(index.complete(query)), options["repeat"])
+                self.stdout.write(f"{query:<12} {count:>7} lemmas  {summary}")
+            else:
+                lemmas = search_lemmas(query).order_by("-core_count", "-pk")
+                count = lemmas.count()
+                summary = self.time(lambda: (lemmas.count(), list(lemmas[:20])), options["repeat"])
+                self.stdout.write(f"{query:<12} {count:>7} lemmas  {summary}  {', '.join(self.scans(lemmas))}")
+
+    def time(self, search, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            search()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        p95 = timings[min(int(len(timings) * 0.95), len(timings) - 1)]
+        return f"median {statistics.median(timings):8.2f}ms  p95 {p95:8.2f}ms"
+
+    def scans(self, queryset):
+        """
+        The distinct scan nodes (and the index each uses) in the plan of
+        counting `queryset`.
+        """
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN SELECT COUNT(*) FROM ({sql}) counted", params)
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+        scans = []
+        for match in re.finditer(r"((?:Parallel )?(?:Seq|Index Only|Index|Bitmap Index|Bitmap Heap) Scan)(?: using (\S+))? on (\S+)", plan):
+            scan = f"{match.group(1)} {match.group(2) or match.group(3)}"
+            if scan not in scans:
+                scans.append(scan)
+        return scans
@@ -0,0 +1,96 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from deep_vocabulary.build import corpus_stages, peak_rss
+from deep_vocabulary.models import BuildCheckpoint
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Load the corpus and run every post-import step, resuming after "
+        "the last completed stage of an interrupted build"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("edition_filename")
+        parser.add_argument("dictionary_filename")
+        parser.add_argument("passage_lemmas_filename")
+        parser.add_argument("source")
+        parser.add_argument(
+            "--core", dest="core_filename", default="./data/core_works_urn.txt",
+            help="file of CTS URN prefixes making up the core reading list",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=1,
+            help="number of processes used by the import",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=100000,
+            help="rows per COPY batch",
+        )
+        parser.add_argument(
+            "--keep-indexes", action="store_true",
+            help="maintain indexes and foreign keys during the import instead of rebuilding them",
+        )
+        parser.add_argument(
+            "--restart", action="store_true",
+            help="ignore checkpoints and rebuild from the first stage",
+        )
+
+    def inputs(self, options):
+        # a build only resumes if it was started from the same files
+        files = [
+            options[name]
+            for name in [
+                "edition_filename",
+                "dictionary_filename",
+                "passage_lemmas_filename",
+                "core_filename",
+            ]
+        ]
+        return json.dumps({
+            "files": [[path, os.path.getsize(path), os.path.getmtime(path)] for path in files],
+            "source": options["source"],
+        })
+
+    def handle(self, *args, **options):
+        inputs = self.inputs(options)
+        if options["restart"]:
+            BuildCheckpoint.objects.all().delete()
+        else:
+            BuildCheckpoint.objects.exclude(inputs=inputs).delete()
+
+        stages = corpus_stages(options)
+        build_started = time.time()
+        for i, (name, stage) in enumerate(stages):
+            if BuildCheckpoint.objects.filter(stage=name).exists():
+                self.stdout.write(f"{name}: already completed")
+                continue
+            # anything downstream of a stage being (re)run is stale
+            BuildCheckpoint.objects.filter(
+                stage__in=[later for later, _ in stages[i + 1:]]
+            ).delete()
+
+            self.stdout.write(f"{name}: starting")
+            started = time.time()
+            rows = stage()
+            elapsed = time.time() - started
+            BuildCheckpoint.objects.create(
+                stage=name,
+                inputs=inputs,
+                rows=rows,
+                elapsed=elapsed,
+            )
+
+            own_rss, child_rss = peak_rss()
+            rate = f"{rows / elapsed:.0f} rows/sec" if rows and elapsed else "-"
+            self.stdout.write(self.style.SUCCESS(
+                f"{name}: {elapsed:.1f}s, {rows} rows ({rate}), "
+                f"peak RSS {own_rss:.0f} MB (workers {child_rss:.0f} MB)"
+            ))
+
+        self.stdout.write(f"corpus built in {time.time() - build_started:.1f}s")
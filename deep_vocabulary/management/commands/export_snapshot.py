@@ -0,0 +1,23 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from deep_vocabulary.engine import export_snapshot
+
+
+class Command(BaseCommand):
+
+    help = "Write the corpus counts and lemma and edition metadata to the snapshot file the site maps"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output", default=None,
+            help="snapshot path (defaults to the CORPUS_SNAPSHOT setting)",
+        )
+
+    def handle(self, *args, **options):
+        path = options["output"] or settings.CORPUS_SNAPSHOT
+        count = export_snapshot(path)
+        size = os.path.getsize(path)
+        self.stdout.write(f"wrote {count} passage lemma counts ({size / 1024 / 1024:.1f} MB) to {path}")
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from deep_vocabulary.models import import_data
+
+
+class Command(BaseCommand):
+
+    help = "Load editions, a dictionary and a bag-of-words file into the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("edition_filename")
+        parser.add_argument("dictionary_filename")
+        parser.add_argument("passage_lemmas_filename")
+        parser.add_argument("source")
+        parser.add_argument(
+            "--workers", type=int, default=1,
+            help="number of processes parsing and COPYing the bag-of-words file",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=100000,
+            help="rows per COPY batch",
+        )
+        parser.add_argument(
+            "--defer-indexes", action="store_true",
+            help="drop indexes and foreign keys while loading and rebuild them afterwards",
+        )
+
+    def handle(self, *args, **options):
+        import_data(
+            options["edition_filename"],
+            options["dictionary_filename"],
+            options["passage_lemmas_filename"],
+            options["source"],
+            batch_size=options["batch_size"],
+            workers=options["workers"],
+            defer_indexes=options["defer_indexes"],
+        )
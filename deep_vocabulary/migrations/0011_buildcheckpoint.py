@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.7 on 2026-10-18 08:46
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deep_vocabulary', '0010_auto_20171215_1205'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BuildCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stage', models.CharField(max_length=100, unique=True)),
+                ('inputs', models.TextField()),
+                ('rows', models.IntegerField(null=True)),
+                ('elapsed', models.FloatField()),
+                ('completed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
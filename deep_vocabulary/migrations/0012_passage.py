@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.7 on 2026-10-18 08:51
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deep_vocabulary', '0011_buildcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Passage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reference', models.CharField(max_length=100)),
+                ('ref1', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=60), default=list, size=None)),
+                ('ref2', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=60), default=list, size=None)),
+                ('ref3', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=60), default=list, size=None)),
+                ('ref4', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=60), default=list, size=None)),
+                ('text_edition', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='passages', to='deep_vocabulary.TextEdition')),
+            ],
+        ),
+        # nullable so the column can be restored before it is backfilled
+        # when this migration is reversed
+        migrations.AlterField(
+            model_name='passagelemma',
+            name='reference',
+            field=models.CharField(max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='passagelemma',
+            name='passage',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='passage_lemmas', to='deep_vocabulary.Passage'),
+        ),
+        migrations.RunSQL(
+            """
+            INSERT INTO deep_vocabulary_passage (text_edition_id, reference, ref1, ref2, ref3, ref4)
+            SELECT DISTINCT ON (text_edition_id, reference)
+                text_edition_id, reference, ref1, ref2, ref3, ref4
+            FROM deep_vocabulary_passagelemma
+            ORDER BY text_edition_id, reference;
+
+            UPDATE deep_vocabulary_passagelemma
+            SET passage_id = p.id
+            FROM deep_vocabulary_passage p
+            WHERE p.text_edition_id = deep_vocabulary_passagelemma.text_edition_id
+                AND p.reference = deep_vocabulary_passagelemma.reference;
+
+            SET CONSTRAINTS ALL IMMEDIATE;
+            """,
+            """
+            UPDATE deep_vocabulary_passagelemma
+            SET reference = p.reference, ref1 = p.ref1, ref2 = p.ref2, ref3 = p.ref3, ref4 = p.ref4
+            FROM deep_vocabulary_passage p
+            WHERE p.id = deep_vocabulary_passagelemma.passage_id;
+
+            SET CONSTRAINTS ALL IMMEDIATE;
+            """,
+        ),
+        migrations.AlterField(
+            model_name='passagelemma',
+            name='passage',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='passage_lemmas', to='deep_vocabulary.Passage'),
+        ),
+        migrations.RemoveField(
+            model_name='passagelemma',
+            name='ref1',
+        ),
+        migrations.RemoveField(
+            model_name='passagelemma',
+            name='ref2',
+        ),
+        migrations.RemoveField(
+            model_name='passagelemma',
+            name='ref3',
+        ),
+        migrations.RemoveField(
+            model_name='passagelemma',
+            name='ref4',
+        ),
+        migrations.RemoveField(
+            model_name='passagelemma',
+            name='reference',
+        ),
+    ]
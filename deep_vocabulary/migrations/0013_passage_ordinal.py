@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.7 on 2026-10-18 08:53
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deep_vocabulary', '0012_passage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='passage',
+            name='ordinal',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE deep_vocabulary_passage SET ordinal = ordered.ordinal
+            FROM (
+                SELECT id, row_number() OVER (
+                    PARTITION BY text_edition_id
+                    ORDER BY
+                        ref1 COLLATE "C", ref2 COLLATE "C",
+                        ref3 COLLATE "C", ref4 COLLATE "C", id
+                ) AS ordinal
+                FROM deep_vocabulary_passage
+            ) ordered
+            WHERE ordered.id = deep_vocabulary_passage.id
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='passage',
+            index=models.Index(fields=['text_edition', 'ordinal'], name='deep_vocabu_text_ed_9f02b9_idx'),
+        ),
+    ]
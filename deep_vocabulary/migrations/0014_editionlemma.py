@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.7 on 2026-10-18 08:55
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deep_vocabulary', '0013_passage_ordinal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EditionLemma',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.IntegerField()),
+                ('lemma', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='editions', to='deep_vocabulary.Lemma')),
+                ('text_edition', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='edition_lemmas', to='deep_vocabulary.TextEdition')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='editionlemma',
+            unique_together=set([('text_edition', 'lemma')]),
+        ),
+        migrations.RunSQL(
+            """
+            INSERT INTO deep_vocabulary_editionlemma (text_edition_id, lemma_id, count)
+            SELECT text_edition_id, lemma_id, SUM(count)
+            FROM deep_vocabulary_passagelemma
+            GROUP BY text_edition_id, lemma_id
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
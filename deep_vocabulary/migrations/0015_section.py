@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.7 on 2026-10-18 08:57
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deep_vocabulary', '0014_editionlemma'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Section',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.IntegerField()),
+                ('reference', models.CharField(max_length=100)),
+                ('first_ordinal', models.IntegerField()),
+                ('last_ordinal', models.IntegerField()),
+                ('text_edition', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sections', to='deep_vocabulary.TextEdition')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SectionLemma',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.IntegerField()),
+                ('lemma', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sections', to='deep_vocabulary.Lemma')),
+                ('section', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='section_lemmas', to='deep_vocabulary.Section')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='section',
+            index=models.Index(fields=['text_edition', 'first_ordinal'], name='deep_vocabu_text_ed_799960_idx'),
+        ),
+    ]
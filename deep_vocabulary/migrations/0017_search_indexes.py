@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deep_vocabulary', '0016_corpusstats'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        # prefix* searches: LIKE 'x%' can only use a pattern_ops B-tree
+        # outside the C locale
+        migrations.RunSQL(
+            """
+            CREATE INDEX deep_vocabulary_lemma_unaccented_like
+            ON deep_vocabulary_lemma (unaccented varchar_pattern_ops)
+            """,
+            "DROP INDEX deep_vocabulary_lemma_unaccented_like",
+        ),
+        # *suffix searches, run as prefix searches on the reversed form
+        migrations.RunSQL(
+            """
+            CREATE INDEX deep_vocabulary_lemma_unaccented_reversed_like
+            ON deep_vocabulary_lemma (REVERSE(unaccented) text_pattern_ops)
+            """,
+            "DROP INDEX deep_vocabulary_lemma_unaccented_reversed_like",
+        ),
+        migrations.RunSQL(
+            """
+            CREATE INDEX deep_vocabulary_lemma_unaccented_trgm
+            ON deep_vocabulary_lemma USING gin (unaccented gin_trgm_ops)
+            """,
+            "DROP INDEX deep_vocabulary_lemma_unaccented_trgm",
+        ),
+        # matches the UPPER(shortdef::text) LIKE UPPER(...) that icontains
+        # compiles to
+        migrations.RunSQL(
+            """
+            CREATE INDEX deep_vocabulary_definition_shortdef_trgm
+            ON deep_vocabulary_definition USING gin (UPPER(shortdef::text) gin_trgm_ops)
+            """,
+            "DROP INDEX deep_vocabulary_definition_shortdef_trgm",
+        ),
+    ]
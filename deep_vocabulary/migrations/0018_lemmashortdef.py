@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.7 on 2026-10-18 09:39
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deep_vocabulary', '0017_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LemmaShortdef',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=100)),
+                ('shortdef', models.TextField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='lemma',
+            name='shortdef',
+            field=models.TextField(null=True),
+        ),
+        migrations.AddField(
+            model_name='lemmashortdef',
+            name='lemma',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shortdefs', to='deep_vocabulary.Lemma'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='lemmashortdef',
+            unique_together=set([('source', 'lemma')]),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.7 on 2026-10-18 09:54
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deep_vocabulary', '0019_deferredindex'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='passage',
+            index=models.Index(fields=['text_edition', 'ref1', 'ref2'], name='deep_vocabu_text_ed_6e974c_idx'),
+        ),
+    ]
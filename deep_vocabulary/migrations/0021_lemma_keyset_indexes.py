@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.7 on 2026-10-18 09:58
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deep_vocabulary', '0020_passage_ref_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='lemma',
+            name='deep_vocabu_sort_ke_6920c9_idx',
+        ),
+        migrations.AddIndex(
+            model_name='lemma',
+            index=models.Index(fields=['sort_key', 'id'], name='deep_vocabu_sort_ke_f6822a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lemma',
+            index=models.Index(fields=['core_count', 'id'], name='deep_vocabu_core_co_3b8641_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lemma',
+            index=models.Index(fields=['corpus_count', 'id'], name='deep_vocabu_corpus__14c1fa_idx'),
+        ),
+    ]
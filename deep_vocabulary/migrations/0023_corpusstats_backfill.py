@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def create_corpus_stats(apps, schema_editor):
+    """
+    Record the token totals of a corpus loaded before CorpusStats as its
+    first version, so the site does not show it with zero totals until
+    the next build.
+    """
+    CorpusStats = apps.get_model("deep_vocabulary", "CorpusStats")
+    TextEdition = apps.get_model("deep_vocabulary", "TextEdition")
+    if CorpusStats.objects.exists():
+        return
+    totals = TextEdition.objects.aggregate(
+        corpus_count=models.Sum("token_count"),
+        core_count=models.Sum(models.Case(
+            models.When(is_core=True, then="token_count"),
+            default=0,
+        )),
+    )
+    if totals["corpus_count"]:
+        CorpusStats.objects.create(
+            corpus_count=totals["corpus_count"],
+            core_count=totals["core_count"] or 0,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deep_vocabulary', '0022_remove_passage_ref_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_corpus_stats, migrations.RunPython.noop),
+    ]
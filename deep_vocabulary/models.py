@@ -1,13 +1,23 @@
-from collections import OrderedDict, deque
-from io import StringIO
-
-from django.db import connection, models
-
+import logging
+import multiprocessing
+import time
+from collections import OrderedDict
+from contextlib import ExitStack
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, models, transaction
+
+from .db.bulk import (CopyWriter, analyze, copy_rows, deferred_indexes,
+                      sequence_ids)
 from .db.fields import ArrayField
 from .greeklit import TEXT_GROUPS, WORKS
-from .querysets import PassageLemmaQuerySet
-from .utils import (chunker, natural_sort_key, pg_array_format, sort_key,
-                    strip_accents)
+from .querysets import PassageLemmaQuerySet, PassageQuerySet
+from .utils import (byte_ranges, lemma_keys, natural_sort_key,
+                    pg_array_format, read_byte_range, sort_key, unaccent)
+
+logger = logging.getLogger(__name__)
 
 
 class Lemma(models.Model):
@@ -20,18 +30,25 @@ class Lemma(models.Model):
     corpus_count = models.IntegerField(default=0)
     core_count = models.IntegerField(default=0)
 
+    # the shortdef from DEFAULT_DEFINITION_SOURCE, filled by update_shortdefs
+    shortdef = models.TextField(null=True)
+
     class Meta:
         indexes = [
             models.Index(fields=["unaccented"]),
-            models.Index(fields=["sort_key"]),
+            # the orderings of the lemma list, for keyset_page to seek in
+            models.Index(fields=["sort_key", "id"]),
+            models.Index(fields=["core_count", "id"]),
+            models.Index(fields=["corpus_count", "id"]),
         ]
 
-    def frequencies(self):  # @@@ might remove this and just do in views
-        corpus_total, core_total = calc_overall_counts()
+    def frequencies(self, totals=None):  # @@@ might remove this and just do in views
+        # callers going through many lemmas can pass calc_overall_counts() once
+        corpus_total, core_total = totals or calc_overall_counts()
 
-        # per 10k
-        corpus_freq = round(10000 * self.corpus_count / corpus_total, 1)
-        core_freq = round(10000 * self.core_count / core_total, 1)
+        # per 10k, and none of a corpus (or core) that has no tokens yet
+        corpus_freq = round(10000 * self.corpus_count / corpus_total, 1) if corpus_total else 0.0
+        core_freq = round(10000 * self.core_count / core_total, 1) if core_total else 0.0
 
         return corpus_freq, core_freq
 
@@ -54,9 +71,7 @@ class Lemma(models.Model):
         self.save()
 
     def calc_unaccented(self):
-        self.unaccented = strip_accents(self.text).lower()
-        if self.unaccented[-1] in "12345":
-            self.unaccented = self.unaccented[:-1]
+        self.unaccented = unaccent(self.text)
         self.save()
 
     def calc_sort_key(self):
@@ -71,6 +86,20 @@ class Definition(models.Model):
     source = models.CharField(max_length=100)
 
 
+class LemmaShortdef(models.Model):
+    """
+    The shortdef of a lemma's first definition from one of the
+    DEFINITION_SOURCES, filled by update_shortdefs.
+    """
+
+    lemma = models.ForeignKey(Lemma, related_name="shortdefs")
+    source = models.CharField(max_length=100)
+    shortdef = models.TextField()
+
+    class Meta:
+        unique_together = [("source", "lemma")]
+
+
 class TextEdition(models.Model):
     cts_urn = models.CharField(max_length=250, unique=True)
     is_core = models.BooleanField(default=False)
@@ -97,12 +126,10 @@ class TextEdition(models.Model):
         self.save()
 
 
-class PassageLemma(models.Model):
+class Passage(models.Model):
 
-    text_edition = models.ForeignKey(TextEdition, related_name="passage_lemmas")
+    text_edition = models.ForeignKey(TextEdition, related_name="passages")
     reference = models.CharField(max_length=100)
-    lemma = models.ForeignKey(Lemma, related_name="passages")
-    count = models.IntegerField()
 
     # reference hierarchy up to four deep
     ref1 = ArrayField(models.CharField(max_length=60), default=list)
@@ -110,90 +137,562 @@ class PassageLemma(models.Model):
     ref3 = ArrayField(models.CharField(max_length=60), default=list)
     ref4 = ArrayField(models.CharField(max_length=60), default=list)
 
-    objects = PassageLemmaQuerySet.as_manager()
+    # position of the passage within its edition in reference order
+    ordinal = models.IntegerField(default=0)
+
+    objects = PassageQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["text_edition", "ordinal"]),
+        ]
 
     def cts_urn(self):
         return f"{self.text_edition.cts_urn}:{self.reference}"
 
 
-def import_data(edition_filename, dictionary_filename, passage_lemmas_filename, source):
-    editions_by_id = {}
-    count = 0
+class PassageLemma(models.Model):
+
+    passage = models.ForeignKey(Passage, related_name="passage_lemmas")
+    # denormalized from passage so per-edition totals need no join
+    text_edition = models.ForeignKey(TextEdition, related_name="passage_lemmas")
+    lemma = models.ForeignKey(Lemma, related_name="passages")
+    count = models.IntegerField()
+
+    objects = PassageLemmaQuerySet.as_manager()
+
+    @property
+    def reference(self):
+        return self.passage.reference
+
+    def cts_urn(self):
+        return self.passage.cts_urn()
+
+
+class EditionLemma(models.Model):
+    """
+    The total count of a lemma in an edition, rolled up from PassageLemma
+    by update_edition_lemmas so whole-edition queries need not aggregate.
+    """
+
+    text_edition = models.ForeignKey(TextEdition, related_name="edition_lemmas")
+    lemma = models.ForeignKey(Lemma, related_name="editions")
+    count = models.IntegerField()
+
+    class Meta:
+        unique_together = [("text_edition", "lemma")]
+
+
+class Section(models.Model):
+    """
+    A top-level (depth 1, e.g. a book) or second-level (depth 2, e.g. a
+    chapter) division of an edition, covering a contiguous run of passage
+    ordinals. Built by update_sections.
+    """
+
+    text_edition = models.ForeignKey(TextEdition, related_name="sections")
+    depth = models.IntegerField()
+    reference = models.CharField(max_length=100)
+    first_ordinal = models.IntegerField()
+    last_ordinal = models.IntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["text_edition", "first_ordinal"]),
+        ]
+
+
+class SectionLemma(models.Model):
+    """
+    The total count of a lemma in a section.
+    """
+
+    section = models.ForeignKey(Section, related_name="section_lemmas")
+    lemma = models.ForeignKey(Lemma, related_name="sections")
+    count = models.IntegerField()
+
+
+class CorpusStats(models.Model):
+    """
+    Token totals over the whole corpus and over the core editions, written
+    once per build by update_corpus_stats. The most recent row is current
+    and its id is the corpus version.
+    """
+
+    corpus_count = models.BigIntegerField()
+    core_count = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def version(self):
+        return self.pk
+
+
+class BuildCheckpoint(models.Model):
+    """
+    A completed stage of `manage.py build_corpus`, recorded so that an
+    interrupted build can resume from the stage that failed.
+    """
+
+    stage = models.CharField(max_length=100, unique=True)
+    inputs = models.TextField()
+    rows = models.IntegerField(null=True)
+    elapsed = models.FloatField()
+    completed_at = models.DateTimeField(auto_now=True)
+
+
+class DeferredIndex(models.Model):
+    """
+    An index or foreign key dropped by `deferred_indexes` for a bulk load
+    and not yet restored, recorded so that a load which is killed can have
+    it put back by the next one.
+    """
+
+    table = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, unique=True)
+    # a CREATE INDEX statement, or the definition of a foreign key
+    definition = models.TextField()
+    is_foreign_key = models.BooleanField(default=False)
+
+
+def clear_corpus():
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            TRUNCATE
+                deep_vocabulary_lemmashortdef,
+                deep_vocabulary_sectionlemma,
+                deep_vocabulary_section,
+                deep_vocabulary_editionlemma,
+                deep_vocabulary_passagelemma,
+                deep_vocabulary_passage,
+                deep_vocabulary_definition,
+                deep_vocabulary_lemma,
+                deep_vocabulary_textedition
+            RESTART IDENTITY CASCADE
+        """)
+
+
+BULK_CREATE_BATCH_SIZE = 5000
+
+# tables whose indexes and foreign keys import_data can drop while loading
+BULK_LOAD_TABLES = (
+    "deep_vocabulary_passage",
+    "deep_vocabulary_passagelemma",
+    "deep_vocabulary_definition",
+)
+
+PASSAGE_COLUMNS = (
+    "id", "text_edition_id", "reference",
+    "ref1", "ref2", "ref3", "ref4", "ordinal",
+)
+
+PASSAGE_LEMMA_COLUMNS = ("passage_id", "text_edition_id", "lemma_id", "count")
+
+
+def import_data(edition_filename, dictionary_filename, passage_lemmas_filename, source,
+                batch_size=100000, workers=1, defer_indexes=False):
     with open(edition_filename) as f:
-        for line in f:
-            edition_id, cts_urn = line.strip().split("|")
-            text_edition, _ = TextEdition.objects.get_or_create(cts_urn=cts_urn)
-            editions_by_id[edition_id] = text_edition
-            count += 1
-    print(f"{count} editions")
-    lemmas_by_text = {}
-    lemmas_by_id = {}
-    count = 0
+        edition_urns = OrderedDict(line.strip().split("|") for line in f)
+    edition_ids = dict(
+        TextEdition.objects.filter(
+            cts_urn__in=edition_urns.values()
+        ).values_list("cts_urn", "id")
+    )
+    new_editions = TextEdition.objects.bulk_create([
+        TextEdition(cts_urn=cts_urn)
+        for cts_urn in OrderedDict.fromkeys(edition_urns.values())
+        if cts_urn not in edition_ids
+    ])
+    edition_ids.update((edition.cts_urn, edition.id) for edition in new_editions)
+    editions_by_id = {
+        edition_id: edition_ids[cts_urn]
+        for edition_id, cts_urn in edition_urns.items()
+    }
+    logger.info("%d editions", len(editions_by_id))
+
     with open(dictionary_filename) as f:
-        for chunk in chunker(f.readlines(), 200):
-            definitions = deque()
-            for line in chunk:
-                lemma_id, lemma_text, shortdef = line.strip().split("|")
-                if lemma_text not in lemmas_by_text:
-                    lemma = Lemma.objects.create(text=lemma_text)
-                else:
-                    lemma = lemmas_by_text[lemma_text]
-                definitions.append(
-                    Definition(
-                        lemma=lemma,
-                        shortdef=shortdef,
-                        source=source,
-                    )
+        entries = [line.strip().split("|") for line in f]
+    lemma_ids = dict(Lemma.objects.values_list("text", "id"))
+    lemma_texts = [
+        lemma_text
+        for lemma_text in OrderedDict.fromkeys(
+            lemma_text for _, lemma_text, _ in entries
+        )
+        if lemma_text not in lemma_ids
+    ]
+    new_lemmas = Lemma.objects.bulk_create(
+        [
+            Lemma(text=lemma_text, unaccented=keys[0], sort_key=keys[1])
+            for lemma_text, keys in zip(
+                lemma_texts,
+                compute_lemma_keys(lemma_texts, workers=workers),
+            )
+        ],
+        batch_size=BULK_CREATE_BATCH_SIZE,
+    )
+    lemma_ids.update((lemma.text, lemma.id) for lemma in new_lemmas)
+    with ExitStack() as stack:
+        if defer_indexes:
+            stack.enter_context(deferred_indexes(*BULK_LOAD_TABLES, workers=max(workers, 2)))
+        Definition.objects.bulk_create(
+            [
+                Definition(
+                    lemma_id=lemma_ids[lemma_text],
+                    shortdef=shortdef,
+                    source=source,
                 )
-                lemmas_by_id[lemma_id] = lemma
-                count += 1
-            Definition.objects.bulk_create(definitions)
-            definitions.clear()
-    print(f"{count} lemmas")
-    count1 = 0
-    count2 = 0
-    with open(passage_lemmas_filename) as f:
-        buf = StringIO()
-        for line in f:
-            passage, lemma_list = line.strip().split("|")
-            edition_id, passage_ref = passage.split(":")
-            for lemma_count in lemma_list.split():
-                if "." in lemma_count:
-                    lemma_id, lcount = lemma_count.split(".")
-                    lcount = int(lcount)
-                else:
-                    lemma_id = lemma_count
-                    lcount = 1
-                row = OrderedDict()
-                row["text_edition_id"] = editions_by_id[edition_id].id
-                row["reference"] = passage_ref
-                row["lemma_id"] = lemmas_by_id[lemma_id].id
-                row["count"] = lcount
-                ref_sort_key = natural_sort_key(passage_ref, depth=4)
-                row["ref1"] = pg_array_format(ref_sort_key[0])
-                row["ref2"] = pg_array_format(ref_sort_key[1])
-                row["ref3"] = pg_array_format(ref_sort_key[2])
-                row["ref4"] = pg_array_format(ref_sort_key[3])
-                buf.write("\t".join([str(v) for v in row.values()]) + "\n")
-                count2 += 1
-            count1 += 1
-        buf.seek(0)
-        with connection.cursor() as cursor:
-            cursor.copy_from(buf, "deep_vocabulary_passagelemma", columns=row.keys())
-    print(f"{count1} passages; {count2} passage lemmas")
+                for _, lemma_text, shortdef in entries
+            ],
+            batch_size=BULK_CREATE_BATCH_SIZE,
+        )
+        lemmas_by_id = {
+            lemma_id: lemma_ids[lemma_text]
+            for lemma_id, lemma_text, _ in entries
+        }
+        logger.info("%d lemmas", len(entries))
+        count1, count2 = import_passage_lemmas(
+            passage_lemmas_filename,
+            editions_by_id,
+            lemmas_by_id,
+            batch_size=batch_size,
+            workers=workers,
+        )
+        update_passage_ordinals()
+    logger.info("%d passages; %d passage lemmas", count1, count2)
+    if defer_indexes:
+        analyze("deep_vocabulary_lemma", "deep_vocabulary_textedition")
+    return count2
+
+
+def passage_rows(lines, edition_ids, lemma_ids, passage_ids):
+    """
+    Parse bag-of-words lines, yielding for each a Passage row (in the order
+    of PASSAGE_COLUMNS) and its PassageLemma rows (in the order of
+    PASSAGE_LEMMA_COLUMNS).
+
+    `edition_ids` and `lemma_ids` map the ids used in the data files to
+    database ids; new passage ids are drawn from the `passage_ids` iterator.
+    """
+    for line in lines:
+        passage, lemma_list = line.strip().split("|")
+        edition_id, passage_ref = passage.split(":")
+        text_edition_id = edition_ids[edition_id]
+        passage_id = next(passage_ids)
+        passage_row = (
+            passage_id,
+            text_edition_id,
+            passage_ref,
+            *[
+                pg_array_format(key)
+                for key in natural_sort_key(passage_ref, depth=4)
+            ],
+            0,  # set by update_passage_ordinals once the edition is loaded
+        )
+        passage_lemma_rows = []
+        for lemma_count in lemma_list.split():
+            if "." in lemma_count:
+                lemma_id, lcount = lemma_count.split(".")
+                lcount = int(lcount)
+            else:
+                lemma_id = lemma_count
+                lcount = 1
+            passage_lemma_rows.append(
+                (passage_id, text_edition_id, lemma_ids[lemma_id], lcount)
+            )
+        yield passage_row, passage_lemma_rows
+
+
+_shard_ids = {}
+
+
+def _init_shard_worker(edition_ids, lemma_ids):
+    _shard_ids["editions"] = edition_ids
+    _shard_ids["lemmas"] = lemma_ids
+
+
+def _import_passage_shard(shard):
+    filename, start, end, batch_size = shard
+    with connection.cursor() as cursor:
+        passage_writer = CopyWriter(
+            cursor,
+            "deep_vocabulary_passage",
+            PASSAGE_COLUMNS,
+            batch_size=batch_size,
+        )
+        passage_lemma_writer = CopyWriter(
+            cursor,
+            "deep_vocabulary_passagelemma",
+            PASSAGE_LEMMA_COLUMNS,
+            batch_size=batch_size,
+            depends_on=[passage_writer],
+        )
+        with passage_writer, passage_lemma_writer:
+            for passage_row, passage_lemma_rows in passage_rows(
+                read_byte_range(filename, start, end),
+                _shard_ids["editions"],
+                _shard_ids["lemmas"],
+                sequence_ids(cursor, "deep_vocabulary_passage"),
+            ):
+                passage_writer.write(passage_row)
+                for row in passage_lemma_rows:
+                    passage_lemma_writer.write(row)
+    return passage_writer.count, passage_lemma_writer.count
+
+
+def _import_passage_shard_in_worker(shard):
+    # a pool worker's connection is its own, so is closed after each shard
+    # rather than left for the pool to drop when it exits
+    try:
+        return _import_passage_shard(shard)
+    finally:
+        connection.close()
+
+
+def import_passage_lemmas(filename, edition_ids, lemma_ids, batch_size=100000, workers=1):
+    """
+    Load the bag-of-words file into Passage and PassageLemma.
+
+    With `workers` > 1 the file is split into line-aligned byte ranges that a
+    process pool parses and COPYs concurrently, each worker over its own
+    database connection.
+    """
+    shards = [
+        (filename, start, end, batch_size)
+        for start, end in byte_ranges(filename, workers * 4 if workers > 1 else 1)
+    ]
+    _init_shard_worker(edition_ids, lemma_ids)
+    if workers > 1:
+        # workers must not share the parent's connection
+        connection.close()
+        with multiprocessing.Pool(
+            workers,
+            initializer=_init_shard_worker,
+            initargs=(edition_ids, lemma_ids),
+        ) as pool:
+            results = list(pool.imap_unordered(_import_passage_shard_in_worker, shards))
+    else:
+        results = [_import_passage_shard(shard) for shard in shards]
+    return (
+        sum(passages for passages, _ in results),
+        sum(count for _, count in results),
+    )
+
+
+def update_passage_ordinals():
+    """
+    Number the passages of each edition in reference order. The ref arrays
+    hold natural_sort_key, so comparing them with the "C" collation (code
+    point order, as Python does) gives the same order as sorting on it.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            UPDATE deep_vocabulary_passage SET ordinal = ordered.ordinal
+            FROM (
+                SELECT id, row_number() OVER (
+                    PARTITION BY text_edition_id
+                    ORDER BY
+                        ref1 COLLATE "C", ref2 COLLATE "C",
+                        ref3 COLLATE "C", ref4 COLLATE "C", id
+                ) AS ordinal
+                FROM deep_vocabulary_passage
+            ) ordered
+            WHERE ordered.id = deep_vocabulary_passage.id
+        """)
+        return cursor.rowcount
+
+
+def update_edition_lemmas():
+    started = time.time()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("TRUNCATE deep_vocabulary_editionlemma")
+        cursor.execute("""
+            INSERT INTO deep_vocabulary_editionlemma (text_edition_id, lemma_id, count)
+            SELECT text_edition_id, lemma_id, SUM(count)
+            FROM deep_vocabulary_passagelemma
+            GROUP BY text_edition_id, lemma_id
+        """)
+        count = cursor.rowcount
+    analyze("deep_vocabulary_editionlemma")
+    logger.info("%d edition lemmas rolled up in %.2fs", count, time.time() - started)
+    return count
+
+
+def update_sections():
+    """
+    Roll passage lemma counts up into depth 1 and depth 2 sections, taking
+    the section of a passage from the first components of its reference.
+    Passages whose reference is no deeper than a level are left out of the
+    sections at that level.
+    """
+    started = time.time()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("TRUNCATE deep_vocabulary_sectionlemma, deep_vocabulary_section")
+        cursor.execute("""
+            INSERT INTO deep_vocabulary_section
+                (text_edition_id, depth, reference, first_ordinal, last_ordinal)
+            SELECT
+                text_edition_id,
+                levels.depth,
+                array_to_string((string_to_array(reference, '.'))[1:levels.depth], '.') AS section,
+                MIN(ordinal),
+                MAX(ordinal)
+            FROM deep_vocabulary_passage CROSS JOIN (VALUES (1), (2)) AS levels (depth)
+            WHERE array_length(string_to_array(reference, '.'), 1) > levels.depth
+            GROUP BY text_edition_id, levels.depth, section
+        """)
+        sections = cursor.rowcount
+        cursor.execute("""
+            INSERT INTO deep_vocabulary_sectionlemma (section_id, lemma_id, count)
+            SELECT s.id, pl.lemma_id, SUM(pl.count)
+            FROM deep_vocabulary_section s
+            JOIN deep_vocabulary_passage p
+                ON p.text_edition_id = s.text_edition_id
+                AND p.ordinal BETWEEN s.first_ordinal AND s.last_ordinal
+            JOIN deep_vocabulary_passagelemma pl ON pl.passage_id = p.id
+            GROUP BY s.id, pl.lemma_id
+        """)
+        count = cursor.rowcount
+    analyze("deep_vocabulary_section", "deep_vocabulary_sectionlemma")
+    logger.info("%d sections; %d section lemmas rolled up in %.2fs", sections, count, time.time() - started)
+    return count
+
+
+def section_cover(sections, first, last):
+    """
+    Given (depth, id, first_ordinal, last_ordinal) tuples, pick the sections
+    making up as much of `first` to `last` as possible, preferring depth 1
+    over depth 2. Return the chosen section ids and the (first, last)
+    ordinal ranges left uncovered.
+    """
+    section_ids = []
+    gaps = [(first, last)]
+    for depth in [1, 2]:
+        level = sorted(
+            (section for section in sections if section[0] == depth),
+            key=itemgetter(2),
+        )
+        remaining = []
+        for lo, hi in gaps:
+            for _, pk, section_first, section_last in level:
+                if lo <= section_first and section_last <= hi:
+                    section_ids.append(pk)
+                    if lo < section_first:
+                        remaining.append((lo, section_first - 1))
+                    lo = section_last + 1
+            if lo <= hi:
+                remaining.append((lo, hi))
+        gaps = remaining
+    return section_ids, gaps
+
+
+def range_lemma_counts(text_edition, first, last, lemma_filter=models.Q()):
+    """
+    Return {lemma_id: count} over the passages of `text_edition` with
+    ordinals `first` to `last`.
+
+    Whole sections inside the range are read from their rollups, so only
+    the partial sections at either edge are summed from individual passage
+    lemmas.
+    """
+    section_ids, gaps = section_cover(
+        text_edition.sections.filter(
+            first_ordinal__gte=first,
+            last_ordinal__lte=last,
+        ).values_list("depth", "id", "first_ordinal", "last_ordinal"),
+        first,
+        last,
+    )
+
+    counts = {}
+    if section_ids:
+        counts.update(
+            SectionLemma.objects.filter(
+                models.Q(section__in=section_ids),
+                lemma_filter,
+            ).values_list("lemma").annotate(total=models.Sum("count"))
+        )
+    if gaps:
+        passage_filter = models.Q()
+        for lo, hi in gaps:
+            passage_filter |= models.Q(passage__ordinal__range=(lo, hi))
+        for lemma_id, total in PassageLemma.objects.filter(
+            models.Q(text_edition=text_edition),
+            passage_filter,
+            lemma_filter,
+        ).values_list("lemma").annotate(total=models.Sum("count")):
+            counts[lemma_id] = counts.get(lemma_id, 0) + total
+    return counts
+
+
+def update_shortdefs():
+    """
+    Record the shortdef of the first definition of each lemma from each of
+    the DEFINITION_SOURCES, and copy those from DEFAULT_DEFINITION_SOURCE
+    to the lemmas themselves.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("TRUNCATE deep_vocabulary_lemmashortdef RESTART IDENTITY")
+        cursor.execute("""
+            INSERT INTO deep_vocabulary_lemmashortdef (lemma_id, source, shortdef)
+            SELECT DISTINCT ON (source, lemma_id) lemma_id, source, shortdef
+            FROM deep_vocabulary_definition
+            WHERE source = ANY(%s)
+            ORDER BY source, lemma_id, id
+        """, [settings.DEFINITION_SOURCES])
+        count = cursor.rowcount
+        cursor.execute("""
+            UPDATE deep_vocabulary_lemma
+            SET shortdef = NULL
+            WHERE shortdef IS NOT NULL
+        """)
+        cursor.execute("""
+            UPDATE deep_vocabulary_lemma
+            SET shortdef = lemma_shortdef.shortdef
+            FROM deep_vocabulary_lemmashortdef lemma_shortdef
+            WHERE lemma_shortdef.lemma_id = deep_vocabulary_lemma.id
+                AND lemma_shortdef.source = %s
+        """, [settings.DEFAULT_DEFINITION_SOURCE])
+    return count
+
+
+def lemma_shortdefs(lemma_ids, source):
+    """
+    The shortdef from `source` of each of `lemma_ids` that has one, as a
+    dict, in one query.
+    """
+    return dict(
+        LemmaShortdef.objects.filter(
+            source=source,
+            lemma_id__in=lemma_ids,
+        ).values_list("lemma_id", "shortdef")
+    )
 
 
 def mark_core(filename):
+    started = time.time()
     with open(filename) as f:
-        for line in f:
-            text_editions = TextEdition.objects.filter(
-                cts_urn__startswith=line.strip())
-            if len(text_editions) == 0:
-                print("couldn't find:", line.strip())
-            else:
-                text_edition = text_editions[0]
-                text_edition.is_core = True
-                text_edition.save()
+        urns = [line.strip() for line in f if line.strip()]
+    # each URN marks the first edition whose cts_urn starts with it
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            WITH matched AS (
+                SELECT DISTINCT ON (urn) urn, e.id
+                FROM unnest(%s::text[]) AS urn
+                JOIN deep_vocabulary_textedition e
+                    ON left(e.cts_urn, length(urn)) = urn
+                ORDER BY urn, e.id
+            ), updated AS (
+                UPDATE deep_vocabulary_textedition SET is_core = true
+                WHERE id IN (SELECT id FROM matched)
+            )
+            SELECT urn FROM matched
+        """, [urns])
+        found = {urn for urn, in cursor.fetchall()}
+    for urn in urns:
+        if urn not in found:
+            logger.warning("couldn't find: %s", urn)
+    logger.info("%d of %d core URNs marked in %.2fs", len(found), len(urns), time.time() - started)
+    return len(found)
 
 
 def update_lemma_counts():
@@ -205,6 +704,7 @@ def update_lemma_counts():
             UPDATE deep_vocabulary_lemma SET corpus_count = COALESCE(qs.pc, 0)
             FROM qs WHERE qs.id = deep_vocabulary_lemma.id
         """.format(sql), params)
+        count = cursor.rowcount
 
     qs = Lemma.objects.filter(passages__text_edition__is_core=True).annotate(pc=models.Sum("passages__count"))
     with connection.cursor() as cursor:
@@ -215,39 +715,111 @@ def update_lemma_counts():
             FROM qs WHERE qs.id = deep_vocabulary_lemma.id
         """.format(sql), params)
 
+    return count
 
-def update_edition_token_counts():
-    for edition in TextEdition.objects.all():
-        edition.calc_counts()
 
-
-def update_lemma_unaccented():
-    for lemma in Lemma.objects.iterator():
-        lemma.calc_unaccented()
-
-
-def update_lemma_sort_keys():
-    for lemma in Lemma.objects.iterator():
-        lemma.calc_sort_key()
-
-
-CORPUS_COUNT = None
-CORE_COUNT = None
+def update_edition_token_counts():
+    started = time.time()
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            UPDATE deep_vocabulary_textedition
+            SET token_count = COALESCE(totals.total, 0)
+            FROM deep_vocabulary_textedition e LEFT JOIN (
+                SELECT text_edition_id, SUM(count) AS total
+                FROM deep_vocabulary_passagelemma
+                GROUP BY text_edition_id
+            ) totals ON totals.text_edition_id = e.id
+            WHERE e.id = deep_vocabulary_textedition.id
+        """)
+        count = cursor.rowcount
+    logger.info("%d edition token counts updated in %.2fs", count, time.time() - started)
+    return count
+
+
+def compute_lemma_keys(texts, workers=1):
+    """
+    Compute (unaccented, sort_key) for each of `texts`, spreading the work
+    over a process pool when `workers` > 1.
+    """
+    if workers > 1:
+        connection.close()
+        with multiprocessing.Pool(workers) as pool:
+            return pool.map(lemma_keys, texts, chunksize=2000)
+    return [lemma_keys(text) for text in texts]
+
+
+def update_lemma_keys(workers=1, batch_size=100000):
+    """
+    Re-derive unaccented and sort_key for every lemma already in the
+    database with a single UPDATE from a staged temporary table.
+    """
+    lemmas = list(Lemma.objects.values_list("id", "text"))
+    keys = compute_lemma_keys([text for _, text in lemmas], workers=workers)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("""
+            CREATE TEMPORARY TABLE lemma_keys (
+                id integer PRIMARY KEY,
+                unaccented varchar(100),
+                sort_key text
+            ) ON COMMIT DROP
+        """)
+        copy_rows(
+            cursor,
+            "lemma_keys",
+            ("id", "unaccented", "sort_key"),
+            ((pk, *lemma_key) for (pk, _), lemma_key in zip(lemmas, keys)),
+            batch_size=batch_size,
+        )
+        cursor.execute("""
+            UPDATE deep_vocabulary_lemma
+            SET unaccented = lemma_keys.unaccented, sort_key = lemma_keys.sort_key
+            FROM lemma_keys WHERE lemma_keys.id = deep_vocabulary_lemma.id
+        """)
+
+
+CORPUS_STATS_CACHE_KEY = "deep_vocabulary:corpus_stats"
+
+
+def update_corpus_stats():
+    """
+    Record the corpus and core token totals (from the per-edition token
+    counts) as a new corpus version.
+    """
+    totals = TextEdition.objects.aggregate(
+        corpus_count=models.Sum("token_count"),
+        core_count=models.Sum(models.Case(
+            models.When(is_core=True, then="token_count"),
+            default=0,
+        )),
+    )
+    stats = CorpusStats.objects.create(
+        corpus_count=totals["corpus_count"] or 0,
+        core_count=totals["core_count"] or 0,
+    )
+    logger.info("corpus version %d: %d tokens, %d core", stats.version, stats.corpus_count, stats.core_count)
+    return 1
+
+
+def invalidate_corpus_stats():
+    cache.delete(CORPUS_STATS_CACHE_KEY)
+
+
+def current_corpus_stats():
+    """
+    The current CorpusStats, read through the cache. A database that has
+    never been through update_corpus_stats has no version yet, and gets
+    unsaved zero totals (with a version of None) that are not cached, so
+    the first version is picked up as soon as a build records it.
+    """
+    stats = cache.get(CORPUS_STATS_CACHE_KEY)
+    if stats is None:
+        stats = CorpusStats.objects.order_by("-pk").first()
+        if stats is None:
+            return CorpusStats(corpus_count=0, core_count=0)
+        cache.set(CORPUS_STATS_CACHE_KEY, stats, settings.CORPUS_STATS_CACHE_TIMEOUT)
+    return stats
 
 
 def calc_overall_counts():
-    global CORPUS_COUNT, CORE_COUNT
-
-    if not CORPUS_COUNT:
-        CORPUS_COUNT = PassageLemma.objects.all().aggregate(
-            models.Sum("count")
-        )["count__sum"]
-
-    if not CORE_COUNT:
-        CORE_COUNT = PassageLemma.objects.filter(
-            text_edition__is_core=True
-        ).aggregate(
-            models.Sum("count")
-        )["count__sum"]
-
-    return CORPUS_COUNT, CORE_COUNT
+    stats = current_corpus_stats()
+    return stats.corpus_count, stats.core_count
@@ -0,0 +1,139 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import connection
+
+
+def encode_cursor(value, pk, index):
+    return base64.urlsafe_b64encode(
+        json.dumps([value, pk, index], ensure_ascii=False).encode("utf-8")
+    ).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    The (value, pk, index) of a cursor, or None if it is malformed.
+    """
+    try:
+        value, pk, index = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8"))
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(pk, int) or not isinstance(index, int):
+        return None
+    return value, pk, index
+
+
+class KeysetPage:
+    """
+    One page of a queryset ordered by `field` (then primary key) that was
+    fetched by seeking from a cursor rather than by OFFSET, so deep pages
+    cost the same as the first.
+
+    Each cursor carries the ordering value and primary key of the row next
+    to the page it leads to, plus that row's position, which is used only
+    to show "lemmas x–y of n".
+    """
+
+    def __init__(self, object_list, start, count, per_page, field):
+        self.object_list = object_list
+        self.start = start
+        self.count = count
+        self.per_page = per_page
+        self.field = field
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def number(self):
+        return self.start // self.per_page + 1
+
+    @property
+    def num_pages(self):
+        return max(-(-self.count // self.per_page), 1)
+
+    def start_index(self):
+        return self.start + 1 if self.object_list else 0
+
+    def end_index(self):
+        return self.start + len(self.object_list)
+
+    def has_previous(self):
+        return self.start > 0
+
+    def has_next(self):
+        return self.end_index() < self.count
+
+    def cursor(self, obj, index):
+        return encode_cursor(getattr(obj, self.field), obj.pk, index)
+
+    def previous_cursor(self):
+        if self.has_previous() and self.object_list:
+            return self.cursor(self.object_list[0], self.start)
+
+    def next_cursor(self):
+        if self.has_next() and self.object_list:
+            return self.cursor(self.object_list[-1], self.end_index() - 1)
+
+
+def keyset_page(queryset, order, count, after=None, before=None, last=False, per_page=20):
+    """
+    The KeysetPage of `queryset` under `order` (a field name, with "-" for
+    descending) after the `after` cursor, before the `before` cursor, at
+    the end if `last`, or else at the start. `count` is the total number of
+    rows, which the caller can cache.
+    """
+    descending = order.startswith("-")
+    field = order.lstrip("-")
+    opts = queryset.model._meta
+    qn = connection.ops.quote_name
+    columns = ", ".join(
+        f"{qn(opts.db_table)}.{qn(column)}"
+        for column in [opts.get_field(field).column, opts.pk.column]
+    )
+
+    def seek(cursor, forwards):
+        value, pk, index = cursor
+        # a row comparison is one range of the (field, id) index, where
+        # field > value OR (field = value AND id > pk) is not; forwards
+        # through a descending order looks for smaller rows
+        operator = ">" if forwards != descending else "<"
+        return queryset.extra(
+            where=[f"({columns}) {operator} (%s, %s)"],
+            params=[value, pk],
+        ), index
+
+    def parse(cursor):
+        cursor = cursor and decode_cursor(cursor)
+        if cursor:
+            value, pk, index = cursor
+            try:
+                value = queryset.model._meta.get_field(field).to_python(value)
+            except ValidationError:
+                return None
+            return value, pk, index
+
+    after = parse(after)
+    before = parse(before)
+    forwards_order = [f"{'-' if descending else ''}{field}", f"{'-' if descending else ''}pk"]
+    backwards_order = [f"{'' if descending else '-'}{field}", f"{'' if descending else '-'}pk"]
+
+    if after:
+        rows, index = seek(after, True)
+        object_list = list(rows.order_by(*forwards_order)[:per_page])
+        start = index + 1
+    elif before:
+        rows, index = seek(before, False)
+        object_list = list(reversed(rows.order_by(*backwards_order)[:per_page]))
+        start = max(index - len(object_list), 0)
+    elif last and count:
+        object_list = list(reversed(queryset.order_by(*backwards_order)[:(count - 1) % per_page + 1]))
+        start = count - len(object_list)
+    else:
+        object_list = list(queryset.order_by(*forwards_order)[:per_page])
+        start = 0
+    return KeysetPage(object_list, start, count, per_page, field)
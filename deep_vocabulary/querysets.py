@@ -1,9 +1,9 @@
-from django.db import models
+from django.db import connection, models
 
-from .utils import natural_sort_key
+from .utils import natural_sort_key, ref_range_keys
 
 
-class PassageLemmaQuerySet(models.QuerySet):
+class PassageQuerySet(models.QuerySet):
 
     def filter_by_ref(self, ref):
         return self.filter(Q_by_ref(ref))
@@ -15,10 +15,65 @@ class PassageLemmaQuerySet(models.QuerySet):
         dash = "-" if desc else ""
         return self.order_by(f"{dash}ref1", f"{dash}ref2", f"{dash}ref3", f"{dash}ref4")
 
+    def ordinal_range(self, ref):
+        """
+        Return the (first, last) ordinals of the passages covered by `ref`,
+        either a single (possibly partial) reference or a `start-end` range,
+        from the first passage at or after `start` to the last at or before
+        `end`, or None if there are none or `ref` is malformed. Call on
+        passages of a single edition.
+        """
+        keys = ref_range_keys(ref)
+        if keys is None:
+            return None
+        start, end = keys
+        # ordinals number the passages in reference order, so the first
+        # passage at or after `start` has the lowest ordinal of those whose
+        # leading levels compare at or after it, and likewise the last
+        table = self.model._meta.db_table
+        ordinals = self.order_by().values_list("ordinal", flat=True)
+        first = ordinals.extra(**ref_comparison(table, start, ">=")).order_by("ordinal").first()
+        last = ordinals.extra(**ref_comparison(table, end, "<=")).order_by("-ordinal").first()
+        if first is None or last is None:
+            return None
+        if first > last:
+            return None
+        return first, last
+
+
+class PassageLemmaQuerySet(models.QuerySet):
+
+    def filter_by_ref(self, ref):
+        return self.filter(Q_by_ref(ref, prefix="passage__"))
+
+    def exclude_by_ref(self, ref):
+        return self.exclude(Q_by_ref(ref, prefix="passage__"))
+
+    def order_by_ref(self, desc=False):
+        dash = "-" if desc else ""
+        return self.order_by(
+            f"{dash}passage__ref1",
+            f"{dash}passage__ref2",
+            f"{dash}passage__ref3",
+            f"{dash}passage__ref4",
+        )
 
-def Q_by_ref(ref, lookup="exact"):
+
+def Q_by_ref(ref, lookup="exact", prefix=""):
     kwargs = {}
     sort_key = natural_sort_key(ref, depth=4)
     for i, k in enumerate(filter(bool, sort_key)):
-        kwargs[f"ref{i + 1}__{lookup}"] = k
+        kwargs[f"{prefix}ref{i + 1}__{lookup}"] = k
     return models.Q(**kwargs)
+
+
+def ref_comparison(table, key, operator):
+    """
+    The `extra` arguments comparing the leading reference levels of the
+    passages in `table` with `key` as a row, in the "C" collation that passage ordinals
+    are assigned in.
+    """
+    qn = connection.ops.quote_name
+    columns = ", ".join(f'{qn(table)}.{qn(f"ref{i + 1}")} COLLATE "C"' for i in range(len(key)))
+    values = ", ".join(["%s::varchar[]"] * len(key))
+    return {"where": [f"({columns}) {operator} ({values})"], "params": list(key)}
@@ -1,3 +1,4 @@
+from django.db.models.signals import post_save
 from django.dispatch import receiver
 
 from account.signals import password_changed
@@ -6,6 +7,8 @@ from account.signals import user_login_attempt, user_logged_in
 
 from pinax.eventlog.models import log
 
+from .models import CorpusStats, invalidate_corpus_stats
+
 
 @receiver(user_logged_in)
 def handle_user_logged_in(sender, **kwargs):
@@ -57,3 +60,8 @@ def handle_user_signed_up(sender, **kwargs):
         action="USER_SIGNED_UP",
         extra={}
     )
+
+
+@receiver(post_save, sender=CorpusStats)
+def handle_corpus_stats_saved(sender, **kwargs):
+    invalidate_corpus_stats()
@@ -0,0 +1,249 @@
+import threading
+from bisect import bisect_left
+
+import numpy as np
+
+from django.db.models import Case, Func, IntegerField, Q, Value, When
+
+from .models import Definition, Lemma, current_corpus_stats
+from .utils import AFTER_ALL, strip_accents
+
+
+# lemmas a fuzzy search finds
+FUZZY_MATCHES = 20
+
+
+class Reverse(Func):
+    """
+    The characters of a string in reverse order, which lets a suffix search
+    run as a prefix search on the reversed-string index.
+    """
+
+    function = "REVERSE"
+
+
+def search_lemmas(query, queryset=None, fuzzy=False):
+    """
+    The lemmas of `queryset` (or all lemmas) matching a lemma list search.
+
+    A `fuzzy` search finds the FUZZY_MATCHES lemmas whose unaccented form
+    is closest to the query, annotated with their `fuzzy_rank`.
+
+    `*suffix` and `prefix*` match the unaccented form and are answered from
+    the reversed and pattern indexes on it. Anything else matches the
+    unaccented form exactly or a substring of a short definition, which is
+    answered from the trigram index on definitions.
+    """
+    if queryset is None:
+        queryset = Lemma.objects.all()
+    query = strip_accents(query).lower()
+    if fuzzy:
+        lemma_ids = lemma_index().fuzzy(query)
+        if not lemma_ids:
+            return queryset.none().annotate(fuzzy_rank=Value(0, output_field=IntegerField()))
+        return queryset.filter(pk__in=lemma_ids).annotate(fuzzy_rank=Case(
+            *[When(pk=lemma_id, then=Value(rank)) for rank, lemma_id in enumerate(lemma_ids)],
+            output_field=IntegerField(),
+        ))
+    elif query.startswith("*"):
+        return queryset.annotate(
+            unaccented_reversed=Reverse("unaccented"),
+        ).filter(unaccented_reversed__startswith=query[1:][::-1])
+    elif query.endswith("*"):
+        return queryset.filter(unaccented__startswith=query[:-1])
+    else:
+        # a subquery rather than a join, which would repeat a lemma once
+        # per matching definition
+        return queryset.filter(
+            Q(unaccented=query) |
+            Q(pk__in=Definition.objects.filter(shortdef__icontains=query).values("lemma"))
+        )
+
+
+class LemmaIndex:
+    """
+    Every lemma's unaccented form in code point order, with the reversed
+    forms in their own order alongside, so the lemmas whose form has a
+    given prefix (or suffix) are one run of either array, found by binary
+    search.
+
+    Lemmas are also ranked by core count, then corpus count, then form, so
+    the best of a run are its smallest ranks, which np.partition finds in
+    time linear in the run.
+
+    For fuzzy searches, the positions of the forms containing each bigram
+    of the padded forms (" λογος ") are built on first use. A form within
+    `k` edits of the query shares all but at most 2k of the query's
+    bigrams, so only forms sharing that many need their edit distance
+    computed.
+    """
+
+    def __init__(self, version, lemma_ids, forms, texts, core_counts, corpus_counts):
+        self.version = version
+        order = sorted(range(len(forms)), key=lambda i: (forms[i], lemma_ids[i]))
+        self.forms = [forms[i] for i in order]
+        self.texts = [texts[i] for i in order]
+        self.lemma_ids = np.array(lemma_ids, dtype=np.int64)[order]
+        self.core_counts = np.array(core_counts, dtype=np.int64)[order]
+        self.corpus_counts = np.array(corpus_counts, dtype=np.int64)[order]
+
+        # reversed_forms[i] is forms[reversed_positions[i]] backwards
+        self.reversed_positions = np.array(
+            sorted(range(len(self.forms)), key=lambda i: self.forms[i][::-1]), dtype=np.int64,
+        )
+        self.reversed_forms = [self.forms[i][::-1] for i in self.reversed_positions.tolist()]
+
+        # by_rank[r] is the position of the lemma ranked r, ranks its inverse
+        self.by_rank = np.lexsort((np.arange(len(self.forms)), -self.corpus_counts, -self.core_counts))
+        self.ranks = np.empty(len(self.forms), dtype=np.int64)
+        self.ranks[self.by_rank] = np.arange(len(self.forms))
+        self.lengths = np.array([len(form) for form in self.forms], dtype=np.int64)
+        self._bigrams = None
+
+    @classmethod
+    def from_database(cls, version):
+        rows = list(Lemma.objects.values_list("id", "unaccented", "text", "core_count", "corpus_count"))
+        return cls(version, *(
+            [row[column] for row in rows] for column in range(5)
+        ))
+
+    def complete(self, query, limit=10):
+        """
+        The positions of the `limit` best ranked lemmas whose unaccented
+        form starts with `query`, or ends with it if `query` starts with
+        `*`, best first.
+        """
+        query = strip_accents(query).lower().rstrip("*")
+        if query.startswith("*"):
+            suffix = query[1:][::-1]
+            start = bisect_left(self.reversed_forms, suffix)
+            end = bisect_left(self.reversed_forms, suffix + AFTER_ALL, start)
+            ranks = self.ranks[self.reversed_positions[start:end]]
+        else:
+            start = bisect_left(self.forms, query)
+            end = bisect_left(self.forms, query + AFTER_ALL, start)
+            ranks = self.ranks[start:end]
+        if len(ranks) > limit:
+            ranks = np.partition(ranks, limit - 1)[:limit]
+        return self.by_rank[np.sort(ranks)]
+
+    def bigram_index(self):
+        """
+        The ({bigram: id}, indptr, positions) of the forms containing each
+        bigram, positions `indptr[id]` to `indptr[id + 1]` for bigram `id`,
+        and every form's code points as a row of a zero-padded matrix.
+        """
+        if self._bigrams is None:
+            bigram_ids = {}
+            ids = []
+            positions = []
+            codes = np.zeros((len(self.forms), self.lengths.max(initial=0)), dtype=np.int32)
+            for position, form in enumerate(self.forms):
+                codes[position, :len(form)] = [ord(c) for c in form]
+                for bigram in bigrams(form):
+                    ids.append(bigram_ids.setdefault(bigram, len(bigram_ids)))
+                    positions.append(position)
+            ids = np.array(ids, dtype=np.int64)
+            indptr = np.zeros(len(bigram_ids) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(ids, minlength=len(bigram_ids)), out=indptr[1:])
+            positions = np.array(positions, dtype=np.int32)[np.argsort(ids, kind="stable")]
+            self._bigrams = bigram_ids, indptr, positions, codes
+        return self._bigrams
+
+    def fuzzy(self, query, limit=FUZZY_MATCHES):
+        """
+        The ids of the `limit` lemmas whose unaccented form is fewest edits
+        from `query` (up to max_edits(query)), then most frequent in the
+        corpus.
+        """
+        query = strip_accents(query).lower().strip("*")
+        k = max_edits(query)
+        bigram_ids, indptr, positions, codes = self.bigram_index()
+        query_bigrams = bigrams(query)
+        threshold = len(query_bigrams) - 2 * k
+        if threshold > 0:
+            shared = np.bincount(
+                np.concatenate([positions[:0]] + [
+                    positions[indptr[bigram_ids[bigram]]:indptr[bigram_ids[bigram] + 1]]
+                    for bigram in query_bigrams if bigram in bigram_ids
+                ]),
+                minlength=len(self.forms),
+            )
+            candidates = np.flatnonzero(shared >= threshold)
+        else:
+            candidates = np.arange(len(self.forms))
+        candidates = candidates[np.abs(self.lengths[candidates] - len(query)) <= k]
+        distances = edit_distances(query, codes[candidates, :len(query) + k], self.lengths[candidates])
+        matches = candidates[distances <= k]
+        distances = distances[distances <= k]
+        best = np.lexsort((matches, -self.corpus_counts[matches], distances))[:limit]
+        return self.lemma_ids[matches[best]].tolist()
+
+    def rows(self, positions):
+        return [
+            {
+                "id": int(self.lemma_ids[position]),
+                "text": self.texts[position],
+                "core_count": int(self.core_counts[position]),
+                "corpus_count": int(self.corpus_counts[position]),
+            }
+            for position in positions.tolist()
+        ]
+
+
+def bigrams(form):
+    """
+    The distinct bigrams of `form` padded with a space at each end, so the
+    first and last letters count as much as the others.
+    """
+    padded = f" {form} "
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+
+def edit_distances(query, codes, lengths):
+    """
+    The Levenshtein distance from `query` to each row of `codes` (forms
+    as zero-padded code points) of length `lengths`, by running the usual
+    dynamic program over every row at once.
+    """
+    steps = np.arange(codes.shape[1] + 1)
+    previous = np.repeat(steps[np.newaxis], len(codes), axis=0)
+    for i, c in enumerate(query, 1):
+        current = np.empty_like(previous)
+        current[:, 0] = i
+        # substitution (or match) and deletion
+        np.minimum(previous[:, :-1] + (codes != ord(c)), previous[:, 1:] + 1, out=current[:, 1:])
+        # insertion: current[j] = min over j' <= j of current[j'] + j - j'
+        current = np.minimum.accumulate(current - steps, axis=1) + steps
+        previous = current
+    return previous[np.arange(len(codes)), lengths]
+
+
+def max_edits(query):
+    """
+    The most edits a fuzzy search for `query` allows: none for one or two
+    letters, one up to five letters, and two beyond.
+    """
+    if len(query) <= 2:
+        return 0
+    elif len(query) <= 5:
+        return 1
+    else:
+        return 2
+
+
+_lemma_index = None
+_lemma_index_lock = threading.Lock()
+
+
+def lemma_index():
+    """
+    The LemmaIndex of the current corpus version, built from the lemma
+    table on first use and again once a rebuild changes the version.
+    """
+    global _lemma_index
+    version = current_corpus_stats().version
+    with _lemma_index_lock:
+        if _lemma_index is None or _lemma_index.version != version:
+            _lemma_index = LemmaIndex.from_database(version)
+        return _lemma_index
@@ -194,6 +194,11 @@ LOGGING = {
             "class": "logging.StreamHandler",
             "formatter": "django.server",
         },
+        "progress": {
+            "level": "INFO",
+            "class": "logging.StreamHandler",
+            "formatter": "simple",
+        },
     },
     "loggers": {
         "django.request": {
@@ -206,6 +211,13 @@ LOGGING = {
             "level": "INFO",
             "propagate": False,
         },
+        # progress of the build stages and bulk loads, reported while
+        # build_corpus runs
+        "deep_vocabulary": {
+            "handlers": ["progress"],
+            "level": "INFO",
+            "propagate": False,
+        },
         "mozilla_django_oidc": {
             "handlers": ["console"],
             "level": "DEBUG",
@@ -247,6 +259,49 @@ if "SENTRY_DSN" in os.environ:
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_URLS_REGEX = r"^.*/json/$"
 
+# the default cache holds the corpus totals and lemma list counts, and is shared
+# by the web processes and the build so that a build's invalidation reaches
+# every process: the database cache by default (created by `manage.py
+# createcachetable`), or CACHE_BACKEND at CACHE_LOCATION, such as
+# django.core.cache.backends.memcached.MemcachedCache at host:port
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND", "django.core.cache.backends.db.DatabaseCache"),
+        "LOCATION": os.environ.get("CACHE_LOCATION", "deep_vocabulary_cache"),
+    },
+}
+
+# how long a worker may keep serving the previous corpus totals after a
+# build; with a cache shared between workers the build invalidates at once
+CORPUS_STATS_CACHE_TIMEOUT = int(os.environ.get("CORPUS_STATS_CACHE_TIMEOUT", 300))
+
+# Cache-Control max-age of word lists and lemma pages and their JSON, which
+# are revalidated against the corpus version by ETag once it runs out
+CORPUS_CACHE_MAX_AGE = int(os.environ.get("CORPUS_CACHE_MAX_AGE", 60 * 60 * 24))
+
+# "memory" answers whole-edition counts from a matrix of the EditionLemma
+# table loaded into each process on first use; "sql" queries the table
+VOCABULARY_ENGINE = os.environ.get("VOCABULARY_ENGINE", "memory")
+
+# written by `manage.py export_snapshot` (and the last build_corpus stage) and
+# mapped by every process in place of loading the corpus matrix itself
+CORPUS_SNAPSHOT = os.environ.get("CORPUS_SNAPSHOT", os.path.join(PROJECT_ROOT, "data", "corpus.snapshot"))
+
+# word list vocabularies are kept in an in-process LRU cache of at most this
+# many (pickled) bytes, backed by the CACHES alias VOCABULARY_CACHE_ALIAS when
+# one is given so that processes can share them
+VOCABULARY_CACHE_MAX_BYTES = int(os.environ.get("VOCABULARY_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+VOCABULARY_CACHE_ALIAS = os.environ.get("VOCABULARY_CACHE_ALIAS")
+
+# the passage indexes behind ranged word lists are kept per process for the
+# most recently used editions, up to this many bytes of them
+PASSAGE_INDEX_CACHE_MAX_BYTES = int(os.environ.get("PASSAGE_INDEX_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# the dictionary sources whose shortdefs update_shortdefs records, which a
+# request can pick with ?source=, and the one shown when it does not
+DEFINITION_SOURCES = os.environ.get("DEFINITION_SOURCES", "logeion_003").split(",")
+DEFAULT_DEFINITION_SOURCE = os.environ.get("DEFAULT_DEFINITION_SOURCE", DEFINITION_SOURCES[0])
+
 SCAIFE_HOST = os.environ.get("SCAIFE_HOST", "https://scaife.perseus.org")
 
 OIDC_HOST = os.environ.get("OIDC_HOST", "http://localhost:3000")
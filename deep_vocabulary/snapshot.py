@@ -0,0 +1,137 @@
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+
+MAGIC = b"DVSNAP\x00\x01"
+FORMAT = 5
+ALIGNMENT = 64
+
+
+class StringColumn:
+    """
+    A sequence of strings stored as one UTF-8 blob and an array of
+    `len + 1` byte offsets into it, and if any of them are None, a mask of
+    those (stored as empty strings in the blob).
+    """
+
+    def __init__(self, offsets, blob, nulls=None):
+        self.offsets = offsets
+        self.blob = blob
+        self.nulls = nulls
+
+    @classmethod
+    def encode(cls, strings):
+        encoded = [(s or "").encode("utf-8") for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(s) for s in encoded], out=offsets[1:])
+        return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if self.nulls is not None and self.nulls[i]:
+            return None
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+
+def write_snapshot(path, version, arrays, strings):
+    """
+    Write `arrays` ({name: ndarray}) and `strings` ({name: [str]}) to a
+    snapshot file for corpus `version`.
+
+    The file is a magic number, the length of a JSON header describing
+    every array, the header, and then the raw arrays, each aligned so it
+    can be used in place from a memory map. It is written next to `path`
+    and renamed over it, so readers see either the old or the new snapshot.
+    """
+    arrays = dict(arrays)
+    for name, values in strings.items():
+        values = list(values)
+        arrays[f"{name}.offsets"], arrays[f"{name}.blob"] = StringColumn.encode(values)
+        nulls = np.array([value is None for value in values], dtype=np.uint8)
+        if nulls.any():
+            arrays[f"{name}.nulls"] = nulls
+
+    def align(n):
+        return -(-n // ALIGNMENT) * ALIGNMENT
+
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        arrays[name] = array
+        layout[name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": offset,
+        }
+        offset = align(offset + array.nbytes)
+    header = json.dumps({
+        "format": FORMAT,
+        "version": version,
+        "arrays": layout,
+        "strings": sorted(strings),
+    }).encode("utf-8")
+    data_start = align(len(MAGIC) + 8 + len(header))
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return data_start + offset
+
+
+class Snapshot:
+    """
+    A snapshot file mapped read-only into memory. Arrays are views on the
+    map, so every process mapping the same file shares one copy of it in
+    the page cache.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime_ns)
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a corpus snapshot")
+        header_length, = struct.unpack_from("<Q", self.map, len(MAGIC))
+        header_start = len(MAGIC) + 8
+        header = json.loads(self.map[header_start:header_start + header_length].decode("utf-8"))
+        if header["format"] != FORMAT:
+            raise ValueError(f"{path} has snapshot format {header['format']}, not {FORMAT}")
+        self.version = header["version"]
+        self.layout = header["arrays"]
+        self.string_names = header["strings"]
+        self.data_start = -(-(header_start + header_length) // ALIGNMENT) * ALIGNMENT
+
+    def array(self, name):
+        spec = self.layout[name]
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"]))
+        return np.frombuffer(
+            self.map,
+            dtype=dtype,
+            count=count,
+            offset=self.data_start + spec["offset"],
+        ).reshape(spec["shape"])
+
+    def strings(self, name):
+        return StringColumn(
+            self.array(f"{name}.offsets"),
+            self.array(f"{name}.blob"),
+            self.array(f"{name}.nulls") if f"{name}.nulls" in self.layout else None,
+        )
@@ -0,0 +1,191 @@
+import os
+import tempfile
+from unittest import mock
+
+import numpy as np
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from deep_vocabulary.engine import PassageIndex, export_snapshot, passage_key
+from deep_vocabulary.models import (Definition, Lemma, Passage, PassageLemma,
+                                    TextEdition, update_corpus_stats,
+                                    update_edition_lemmas,
+                                    update_edition_token_counts,
+                                    update_lemma_counts, update_shortdefs)
+from deep_vocabulary.snapshot import Snapshot, StringColumn
+from deep_vocabulary.utils import lemma_keys, natural_sort_key
+
+
+def passage_index(references, dense):
+    """
+    A PassageIndex over `references` whose counts are the rows of `dense`
+    (passages × lemmas), with lemma ids 100, 101, ...
+    """
+    rows, indices = np.nonzero(dense)
+    indptr = np.zeros(len(references) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=len(references)), out=indptr[1:])
+    return PassageIndex(
+        StringColumn(*StringColumn.encode([
+            passage_key(natural_sort_key(reference, depth=4)) for reference in references
+        ])),
+        np.arange(100, 100 + dense.shape[1]),
+        indptr,
+        indices.astype(np.int32),
+        dense[rows, indices].astype(np.int32),
+    )
+
+
+class PassageIndexCountsTests(SimpleTestCase):
+
+    def setUp(self):
+        random = np.random.RandomState(0)
+        # enough passages for several checkpoints, and lemmas absent from most
+        self.dense = random.randint(0, 4, size=(300, 12)) * (random.random_sample((300, 12)) < 0.3)
+        self.references = [f"{i // 50 + 1}.{i % 50 + 1}" for i in range(300)]
+
+    def check_counts(self, index):
+        prefix = np.vstack([np.zeros((1, self.dense.shape[1]), dtype=np.int64), np.cumsum(self.dense, axis=0)])
+        for n in range(len(self.references) + 1):
+            np.testing.assert_array_equal(index.prefix_counts(n), prefix[n])
+        for first, last in [(1, 1), (1, 300), (128, 129), (127, 256), (257, 300), (300, 300)]:
+            totals = self.dense[first - 1:last].sum(axis=0)
+            lemma_ids, counts = index.range_counts(first, last)
+            np.testing.assert_array_equal(lemma_ids, 100 + np.flatnonzero(totals))
+            np.testing.assert_array_equal(counts, totals[totals > 0])
+
+    def test_counts(self):
+        index = passage_index(self.references, self.dense)
+        self.assertEqual(index.interval, 128)
+        self.check_counts(index)
+
+    def test_counts_with_a_widened_interval(self):
+        with mock.patch("deep_vocabulary.engine.CHECKPOINT_CELLS", 20):
+            index = passage_index(self.references, self.dense)
+        # 300 passages × 12 lemmas / 20 cells, rounded up
+        self.assertEqual(index.interval, 180)
+        self.check_counts(index)
+
+    def test_range_without_counts(self):
+        self.dense[10:20] = 0
+        lemma_ids, counts = passage_index(self.references, self.dense).range_counts(11, 20)
+        self.assertEqual(len(lemma_ids), 0)
+        self.assertEqual(len(counts), 0)
+
+
+class PassageIndexOrdinalRangeTests(SimpleTestCase):
+
+    def setUp(self):
+        references = ["1.1", "1.2", "1.10", "2.1", "2.1a", "2.2", "10.1"]
+        self.index = passage_index(references, np.ones((len(references), 1), dtype=np.int32))
+
+    def test_ranges(self):
+        self.assertEqual(self.index.ordinal_range("1"), (1, 3))
+        self.assertEqual(self.index.ordinal_range("1.10"), (3, 3))
+        self.assertEqual(self.index.ordinal_range("1.2-2.1"), (2, 4))
+        self.assertEqual(self.index.ordinal_range("2"), (4, 6))
+        self.assertEqual(self.index.ordinal_range("1-10"), (1, 7))
+
+    def test_endpoints_between_passages(self):
+        self.assertEqual(self.index.ordinal_range("1.1-1.11"), (1, 3))
+        self.assertEqual(self.index.ordinal_range("1.5-2.1"), (3, 4))
+        self.assertEqual(self.index.ordinal_range("0-1.3"), (1, 2))
+
+    def test_endpoint_past_the_last_passage(self):
+        self.assertEqual(self.index.ordinal_range("2.2-11"), (6, 7))
+        self.assertEqual(self.index.ordinal_range("1.1-1.700"), (1, 3))
+
+    def test_unmatched(self):
+        self.assertIsNone(self.index.ordinal_range("3"))
+        self.assertIsNone(self.index.ordinal_range("1.3"))
+        self.assertIsNone(self.index.ordinal_range("2-1"))
+        self.assertIsNone(self.index.ordinal_range("11-12"))
+
+    def test_malformed(self):
+        for ref in ["1-2-3", "-1", "1-", "1..2", "1.1.1.1.1"]:
+            with self.subTest(ref=ref):
+                self.assertIsNone(self.index.ordinal_range(ref))
+
+    def test_no_passages(self):
+        self.assertIsNone(passage_index([], np.zeros((0, 0), dtype=np.int32)).ordinal_range("1"))
+
+    def test_nbytes_counts_the_keys(self):
+        keys = self.index.keys
+        self.assertGreater(keys.blob.nbytes, 0)
+        self.assertEqual(
+            self.index.nbytes,
+            keys.offsets.nbytes + keys.blob.nbytes + sum(
+                array.nbytes for array in [
+                    self.index.lemma_ids, self.index.indptr, self.index.indices,
+                    self.index.counts, self.index.checkpoints,
+                ]
+            ),
+        )
+
+
+@override_settings(DEFINITION_SOURCES=["logeion"], DEFAULT_DEFINITION_SOURCE="logeion")
+class SnapshotRoundTripTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.logos, cls.ergon = [
+            Lemma.objects.create(text=text, unaccented=keys[0], sort_key=keys[1])
+            for text, keys in ((text, lemma_keys(text)) for text in ["λόγος", "ἔργον"])
+        ]
+        # ἔργον has no shortdef
+        Definition.objects.create(lemma=cls.logos, source="logeion", shortdef="word")
+        cls.editions = [
+            TextEdition.objects.create(cts_urn=f"urn:cts:greekLit:tlg0001.tlg001.{name}")
+            for name in ["counted", "empty", "uncounted"]
+        ]
+        counted, empty, uncounted = cls.editions
+        for edition, references in [(counted, ["1.1", "1.2", "1.10", "2.1"]), (uncounted, ["1", "2"])]:
+            for ordinal, reference in enumerate(references, 1):
+                passage = Passage.objects.create(
+                    text_edition=edition,
+                    reference=reference,
+                    ordinal=ordinal,
+                    **{
+                        f"ref{i}": key
+                        for i, key in enumerate(natural_sort_key(reference, depth=4), 1)
+                        if key
+                    }
+                )
+                # only the first edition's passages have lemmas
+                if edition == counted:
+                    for lemma in [cls.logos, cls.ergon][:ordinal % 2 + 1]:
+                        PassageLemma.objects.create(
+                            passage=passage, text_edition=edition, lemma=lemma, count=ordinal,
+                        )
+        update_shortdefs()
+        update_edition_lemmas()
+        update_lemma_counts()
+        update_edition_token_counts()
+        update_corpus_stats()
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "corpus.snapshot")
+        export_snapshot(path)
+        self.snapshot = Snapshot(path)
+        self.addCleanup(self.snapshot.map.close)
+
+    def test_passage_indexes_match_the_database(self):
+        for edition in self.editions:
+            with self.subTest(edition=edition.cts_urn):
+                mapped = PassageIndex.from_snapshot(self.snapshot, edition.pk)
+                built = PassageIndex.from_database(edition.pk)
+                self.assertEqual(list(mapped.keys), list(built.keys))
+                np.testing.assert_array_equal(mapped.lemma_ids, built.lemma_ids)
+                self.assertEqual(mapped.interval, built.interval)
+                for n in range(len(built.keys) + 1):
+                    np.testing.assert_array_equal(mapped.prefix_counts(n), built.prefix_counts(n))
+                for ref in ["1", "1.2-2", "3"]:
+                    self.assertEqual(mapped.ordinal_range(ref), built.ordinal_range(ref))
+
+    def test_missing_shortdefs_stay_none(self):
+        lemma_ids = self.snapshot.array("lemma_ids").tolist()
+        shortdefs = self.snapshot.strings("lemma_shortdefs.logeion")
+        self.assertEqual(shortdefs[lemma_ids.index(self.logos.pk)], "word")
+        self.assertIsNone(shortdefs[lemma_ids.index(self.ergon.pk)])
+        self.assertEqual(self.snapshot.strings("lemma_texts")[lemma_ids.index(self.ergon.pk)], "ἔργον")
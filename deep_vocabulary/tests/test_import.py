@@ -0,0 +1,68 @@
+import os
+import tempfile
+
+from django.test import TestCase
+
+from deep_vocabulary.models import (Definition, Lemma, Passage, PassageLemma,
+                                    TextEdition, import_data)
+
+
+class ImportDataTests(TestCase):
+
+    def write(self, name, lines):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "w") as f:
+            f.write("".join(f"{line}\n" for line in lines))
+        return path
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.existing = TextEdition.objects.create(cts_urn="urn:cts:greekLit:tlg0001.tlg001.a")
+        self.files = [
+            self.write("editions.txt", [
+                "1|urn:cts:greekLit:tlg0001.tlg001.a",
+                "2|urn:cts:greekLit:tlg0001.tlg002.b",
+            ]),
+            self.write("dictionary.txt", [
+                "1|λόγος|word",
+                "2|ἔργον|deed",
+                # a duplicate headword
+                "3|λόγος|account",
+            ]),
+            self.write("bag_of_words.txt", [
+                "1:1.2|1.2 2",
+                "1:1.10|3",
+                "2:1|2.4",
+            ]),
+        ]
+
+    def test_editions_and_lemmas_are_created_once(self):
+        import_data(*self.files, "test")
+        self.assertEqual(TextEdition.objects.count(), 2)
+        self.assertTrue(TextEdition.objects.filter(pk=self.existing.pk).exists())
+        self.assertEqual(sorted(Lemma.objects.values_list("text", flat=True)), ["λόγος", "ἔργον"])
+        self.assertEqual(
+            sorted(Definition.objects.filter(lemma__text="λόγος").values_list("shortdef", flat=True)),
+            ["account", "word"],
+        )
+
+    def test_lemmas_get_their_keys(self):
+        import_data(*self.files, "test")
+        self.assertEqual(Lemma.objects.get(text="λόγος").unaccented, "λογος")
+
+    def test_passages_are_numbered_in_reference_order(self):
+        count = import_data(*self.files, "test")
+        self.assertEqual(count, 4)
+        self.assertEqual(
+            list(self.existing.passages.order_by("ordinal").values_list("reference", flat=True)),
+            ["1.2", "1.10"],
+        )
+        # both dictionary ids of the duplicate headword point at one lemma
+        self.assertEqual(
+            sorted(
+                PassageLemma.objects.filter(text_edition=self.existing).values_list("lemma__text", "count")
+            ),
+            [("λόγος", 1), ("λόγος", 2), ("ἔργον", 1)],
+        )
+        self.assertEqual(Passage.objects.filter(text_edition__cts_urn__endswith=".b").count(), 1)
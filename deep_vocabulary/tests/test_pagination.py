@@ -0,0 +1,91 @@
+from django.test import SimpleTestCase, TestCase
+
+from deep_vocabulary.models import Lemma
+from deep_vocabulary.pagination import (decode_cursor, encode_cursor,
+                                        keyset_page)
+
+
+class CursorTests(SimpleTestCase):
+
+    def test_round_trip(self):
+        for value in ["λόγος", 0, 12345, None]:
+            with self.subTest(value=value):
+                self.assertEqual(decode_cursor(encode_cursor(value, 7, 41)), (value, 7, 41))
+
+    def test_url_safe_and_unpadded(self):
+        cursor = encode_cursor("ἀγαθός ~?", 1, 2)
+        self.assertRegex(cursor, r"^[A-Za-z0-9_-]+$")
+
+    def test_malformed(self):
+        for cursor in ["", "garbage", "!!!!", encode_cursor("x", "7", 1)[:-3], encode_cursor("x", "7", 1)]:
+            with self.subTest(cursor=cursor):
+                self.assertIsNone(decode_cursor(cursor))
+
+
+class KeysetPageTests(TestCase):
+
+    per_page = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        # eleven lemmas, with ties in core_count for the primary key to break
+        Lemma.objects.bulk_create([
+            Lemma(text=f"lemma{i:02}", unaccented=f"lemma{i:02}", sort_key=f"{i:02}", core_count=i // 3)
+            for i in range(11)
+        ])
+
+    def page(self, order, **kwargs):
+        return keyset_page(Lemma.objects.all(), order, Lemma.objects.count(), per_page=self.per_page, **kwargs)
+
+    def expected(self, order):
+        descending = "-" if order.startswith("-") else ""
+        return list(Lemma.objects.order_by(order, f"{descending}pk").values_list("pk", flat=True))
+
+    def walk_forwards(self, order):
+        pages = [self.page(order)]
+        while pages[-1].next_cursor():
+            pages.append(self.page(order, after=pages[-1].next_cursor()))
+        return pages
+
+    def walk_backwards(self, order):
+        pages = [self.page(order, last=True)]
+        while pages[-1].previous_cursor():
+            pages.append(self.page(order, before=pages[-1].previous_cursor()))
+        return pages[::-1]
+
+    def test_forwards_and_backwards_visit_every_row_in_order(self):
+        for order in ["sort_key", "-sort_key", "core_count", "-core_count"]:
+            for walk in [self.walk_forwards, self.walk_backwards]:
+                with self.subTest(order=order, walk=walk.__name__):
+                    pages = walk(order)
+                    self.assertEqual([lemma.pk for page in pages for lemma in page], self.expected(order))
+                    self.assertEqual([page.start for page in pages], [0, 4, 8])
+                    self.assertEqual([page.number for page in pages], [1, 2, 3])
+
+    def test_first_and_last_pages(self):
+        first = self.page("-core_count")
+        self.assertFalse(first.has_previous())
+        self.assertIsNone(first.previous_cursor())
+        self.assertEqual((first.start_index(), first.end_index(), first.num_pages), (1, 4, 3))
+        last = self.page("-core_count", last=True)
+        self.assertFalse(last.has_next())
+        self.assertIsNone(last.next_cursor())
+        # the last page holds the remainder
+        self.assertEqual((last.start_index(), last.end_index()), (9, 11))
+
+    def test_page_after_the_last_row_is_empty(self):
+        last = self.page("sort_key", last=True)
+        cursor = last.cursor(last.object_list[-1], 10)
+        page = self.page("sort_key", after=cursor)
+        self.assertEqual(list(page), [])
+        self.assertEqual(page.start_index(), 0)
+
+    def test_cursor_with_an_invalid_value_starts_over(self):
+        page = self.page("core_count", after=encode_cursor("not a number", 1, 5))
+        self.assertEqual(page.start, 0)
+        self.assertEqual([lemma.pk for lemma in page], self.expected("core_count")[:self.per_page])
+
+    def test_empty(self):
+        page = keyset_page(Lemma.objects.none(), "sort_key", 0, last=True, per_page=self.per_page)
+        self.assertEqual(list(page), [])
+        self.assertEqual((page.num_pages, page.start_index(), page.has_next()), (1, 0, False))
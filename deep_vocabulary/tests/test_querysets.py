@@ -0,0 +1,54 @@
+from django.test import TestCase
+
+from deep_vocabulary.models import Passage, TextEdition
+from deep_vocabulary.utils import natural_sort_key
+
+
+class PassageOrdinalRangeTests(TestCase):
+
+    references = ["1.1", "1.2", "1.10", "2.1", "2.1a", "2.2", "10.1"]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.edition = TextEdition.objects.create(cts_urn="urn:cts:greekLit:tlg0001.tlg001.test")
+        for ordinal, reference in enumerate(cls.references, 1):
+            Passage.objects.create(
+                text_edition=cls.edition,
+                reference=reference,
+                ordinal=ordinal,
+                **{
+                    f"ref{i}": key
+                    for i, key in enumerate(natural_sort_key(reference, depth=4), 1)
+                    if key
+                }
+            )
+
+    def ordinal_range(self, ref):
+        return self.edition.passages.ordinal_range(ref)
+
+    def test_ranges(self):
+        self.assertEqual(self.ordinal_range("1"), (1, 3))
+        self.assertEqual(self.ordinal_range("1.10"), (3, 3))
+        self.assertEqual(self.ordinal_range("1.2-2.1"), (2, 4))
+        self.assertEqual(self.ordinal_range("2"), (4, 6))
+        self.assertEqual(self.ordinal_range("1-10"), (1, 7))
+
+    def test_endpoints_between_passages(self):
+        self.assertEqual(self.ordinal_range("1.1-1.11"), (1, 3))
+        self.assertEqual(self.ordinal_range("1.5-2.1"), (3, 4))
+        self.assertEqual(self.ordinal_range("0-1.3"), (1, 2))
+
+    def test_endpoint_past_the_last_passage(self):
+        self.assertEqual(self.ordinal_range("2.2-11"), (6, 7))
+        self.assertEqual(self.ordinal_range("1.1-1.700"), (1, 3))
+
+    def test_unmatched(self):
+        self.assertIsNone(self.ordinal_range("3"))
+        self.assertIsNone(self.ordinal_range("1.3"))
+        self.assertIsNone(self.ordinal_range("2-1"))
+        self.assertIsNone(self.ordinal_range("11-12"))
+
+    def test_malformed(self):
+        for ref in ["1-2-3", "-1", "1-", "1..2", "1.1.1.1.1"]:
+            with self.subTest(ref=ref):
+                self.assertIsNone(self.ordinal_range(ref))
@@ -0,0 +1,92 @@
+import numpy as np
+
+from django.test import SimpleTestCase
+
+from deep_vocabulary.search import LemmaIndex, edit_distances, max_edits
+
+
+def levenshtein(a, b):
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def codes(forms, width):
+    matrix = np.zeros((len(forms), width), dtype=np.int32)
+    for row, form in enumerate(forms):
+        matrix[row, :len(form)] = [ord(c) for c in form]
+    return matrix
+
+
+class EditDistanceTests(SimpleTestCase):
+
+    forms = ["λογος", "λογοι", "λογ", "αλογος", "λγος", "ογος", "νομος", "λ", "λογοσλογος"]
+
+    def test_matches_levenshtein(self):
+        for query in ["λογος", "λογοσ", "λ", "ολγος", "αβγδεζηθ"]:
+            with self.subTest(query=query):
+                np.testing.assert_array_equal(
+                    edit_distances(
+                        query,
+                        codes(self.forms, max(len(form) for form in self.forms)),
+                        np.array([len(form) for form in self.forms]),
+                    ),
+                    [levenshtein(query, form) for form in self.forms],
+                )
+
+    def test_truncated_codes(self):
+        # fuzzy only passes the first len(query) + k code points of each
+        # form, which is enough for the forms that are within k edits
+        query = "λογος"
+        forms = [form for form in self.forms if abs(len(form) - len(query)) <= 2]
+        distances = edit_distances(
+            query,
+            codes(forms, len(query) + 2),
+            np.array([len(form) for form in forms]),
+        )
+        np.testing.assert_array_equal(distances, [levenshtein(query, form) for form in forms])
+
+    def test_no_forms(self):
+        self.assertEqual(len(edit_distances("λογος", codes([], 7), np.zeros(0, dtype=np.int64))), 0)
+
+
+class MaxEditsTests(SimpleTestCase):
+
+    def test_boundaries(self):
+        self.assertEqual(
+            [max_edits("α" * n) for n in range(9)],
+            [0, 0, 0, 1, 1, 1, 2, 2, 2],
+        )
+
+
+class FuzzyTests(SimpleTestCase):
+
+    def setUp(self):
+        forms = ["λογος", "λογοι", "λογον", "νομος", "αγαθος", "αγαθοι", "αγανος", "αγαθα"]
+        self.index = LemmaIndex(
+            1,
+            list(range(1, len(forms) + 1)),
+            forms,
+            forms,
+            [0] * len(forms),
+            [5, 50, 60, 1, 3, 50, 2, 4],
+        )
+
+    def test_closest_first_then_most_frequent(self):
+        # up to one edit for five letters, so not νομος
+        self.assertEqual(self.index.fuzzy("λογος"), [1, 3, 2])
+        # up to two edits beyond
+        self.assertEqual(self.index.fuzzy("αγαθος"), [5, 6, 7, 8])
+
+    def test_accents_and_wildcards_are_ignored(self):
+        self.assertEqual(self.index.fuzzy("λόγος*"), [1, 3, 2])
+
+    def test_limit(self):
+        self.assertEqual(self.index.fuzzy("λογος", limit=2), [1, 3])
+
+    def test_short_queries_must_match_exactly(self):
+        self.assertEqual(self.index.fuzzy("λε"), [])
@@ -0,0 +1,90 @@
+from django.db.models import Q, Sum
+from django.test import SimpleTestCase, TestCase
+
+from deep_vocabulary.models import (Lemma, Passage, PassageLemma, TextEdition,
+                                    range_lemma_counts, section_cover,
+                                    update_sections)
+from deep_vocabulary.utils import lemma_keys, natural_sort_key
+
+
+class SectionCoverTests(SimpleTestCase):
+
+    # books 1 (ordinals 1-4) and 2 (5-8), each of two chapters
+    sections = [
+        (1, 10, 1, 4),
+        (1, 20, 5, 8),
+        (2, 11, 1, 2),
+        (2, 12, 3, 4),
+        (2, 21, 5, 6),
+        (2, 22, 7, 8),
+    ]
+
+    def test_whole_books_are_preferred_to_their_chapters(self):
+        self.assertEqual(section_cover(self.sections, 1, 8), ([10, 20], []))
+
+    def test_chapters_fill_in_around_a_partial_book(self):
+        self.assertEqual(section_cover(self.sections, 3, 8), ([20, 12], []))
+
+    def test_partial_chapters_are_left_as_gaps(self):
+        self.assertEqual(section_cover(self.sections, 2, 7), ([12, 21], [(2, 2), (7, 7)]))
+
+    def test_range_inside_one_chapter(self):
+        self.assertEqual(section_cover(self.sections, 5, 5), ([], [(5, 5)]))
+
+    def test_no_sections(self):
+        self.assertEqual(section_cover([], 1, 8), ([], [(1, 8)]))
+
+
+class RangeLemmaCountsTests(TestCase):
+
+    references = ["1.1.1", "1.1.2", "1.2.1", "2.1.1", "2.1.2", "2.2.1", "3.1"]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.edition = TextEdition.objects.create(cts_urn="urn:cts:greekLit:tlg0001.tlg001.test")
+        cls.lemmas = [
+            Lemma.objects.create(text=text, unaccented=keys[0], sort_key=keys[1])
+            for text, keys in ((text, lemma_keys(text)) for text in ["λόγος", "ἔργον", "καί"])
+        ]
+        for ordinal, reference in enumerate(cls.references, 1):
+            passage = Passage.objects.create(
+                text_edition=cls.edition,
+                reference=reference,
+                ordinal=ordinal,
+                **{
+                    f"ref{i}": key
+                    for i, key in enumerate(natural_sort_key(reference, depth=4), 1)
+                    if key
+                }
+            )
+            for i, lemma in enumerate(cls.lemmas):
+                if (ordinal + i) % 3:
+                    PassageLemma.objects.create(
+                        passage=passage,
+                        text_edition=cls.edition,
+                        lemma=lemma,
+                        count=ordinal * (i + 1),
+                    )
+        update_sections()
+
+    def expected(self, first, last, lemma_filter=Q()):
+        return dict(
+            PassageLemma.objects.filter(
+                Q(text_edition=self.edition),
+                Q(passage__ordinal__range=(first, last)),
+                lemma_filter,
+            ).values_list("lemma").annotate(total=Sum("count"))
+        )
+
+    def test_every_range_matches_the_passage_counts(self):
+        for first in range(1, len(self.references) + 1):
+            for last in range(first, len(self.references) + 1):
+                with self.subTest(first=first, last=last):
+                    self.assertEqual(range_lemma_counts(self.edition, first, last), self.expected(first, last))
+
+    def test_lemma_filter_applies_to_sections_and_passages(self):
+        lemma_filter = Q(lemma=self.lemmas[1])
+        self.assertEqual(
+            range_lemma_counts(self.edition, 2, 6, lemma_filter),
+            self.expected(2, 6, lemma_filter),
+        )
@@ -0,0 +1,59 @@
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from deep_vocabulary.models import Definition, Lemma, update_shortdefs
+from deep_vocabulary.views import definition_source, set_shortdefs
+
+
+@override_settings(DEFINITION_SOURCES=["logeion", "lsj"], DEFAULT_DEFINITION_SOURCE="logeion")
+class DefinitionSourceTests(SimpleTestCase):
+
+    def source(self, query):
+        return definition_source(RequestFactory().get("/lemma/", query))
+
+    def test_configured_source(self):
+        self.assertEqual(self.source({"source": "lsj"}), "lsj")
+
+    def test_default(self):
+        self.assertEqual(self.source({}), "logeion")
+
+    def test_unknown_source_falls_back_to_the_default(self):
+        self.assertEqual(self.source({"source": "unknown"}), "logeion")
+        self.assertEqual(self.source({"source": ""}), "logeion")
+
+
+@override_settings(DEFINITION_SOURCES=["logeion", "lsj"], DEFAULT_DEFINITION_SOURCE="logeion")
+class SetShortdefsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.logos, cls.ergon = Lemma.objects.bulk_create([
+            Lemma(text="λόγος", unaccented="λογος", sort_key="1"),
+            Lemma(text="ἔργον", unaccented="εργον", sort_key="2"),
+        ])
+        Definition.objects.bulk_create([
+            Definition(lemma=cls.logos, source="logeion", shortdef="word"),
+            Definition(lemma=cls.logos, source="logeion", shortdef="a later definition"),
+            Definition(lemma=cls.logos, source="lsj", shortdef="computation, reckoning"),
+            Definition(lemma=cls.ergon, source="logeion", shortdef="deed"),
+            Definition(lemma=cls.ergon, source="unconfigured", shortdef="work"),
+        ])
+        update_shortdefs()
+
+    def lemmas(self):
+        return list(Lemma.objects.order_by("pk"))
+
+    def test_default_source_is_read_from_the_lemmas(self):
+        lemmas = self.lemmas()
+        with self.assertNumQueries(0):
+            set_shortdefs(lemmas, "logeion")
+        self.assertEqual([lemma.shortdef for lemma in lemmas], ["word", "deed"])
+
+    def test_other_source_in_one_query(self):
+        lemmas = self.lemmas()
+        with self.assertNumQueries(1):
+            set_shortdefs(lemmas, "lsj")
+        # ἔργον has no lsj shortdef
+        self.assertEqual([lemma.shortdef for lemma in lemmas], ["computation, reckoning", None])
+
+    def test_no_lemmas(self):
+        set_shortdefs([], "lsj")
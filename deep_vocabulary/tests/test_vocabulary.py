@@ -0,0 +1,38 @@
+from unittest import mock
+
+import numpy as np
+
+from django.test import SimpleTestCase
+
+from deep_vocabulary.vocabulary import ORDERINGS, Vocabulary
+
+
+def vocabulary(ref, corpus_total, core_total):
+    counts = np.array([3, 1])
+    return Vocabulary(
+        ref, np.array([1, 2]), counts, counts * 2 if ref else None,
+        counts, np.array([2, 0]), np.array([1, 0]),
+        8 if ref else None, corpus_total, core_total,
+    )
+
+
+@mock.patch("deep_vocabulary.vocabulary.lemma_metadata", return_value=(["α", "β"], ["1", "2"], [None, None]))
+class ZeroTotalsTests(SimpleTestCase):
+
+    def test_corpus_without_tokens(self, lemma_metadata):
+        # a database that has not recorded a corpus version has zero totals
+        for ref in [None, "1"]:
+            with self.subTest(ref=ref):
+                words = vocabulary(ref, 0, 0)
+                rows = words.rows([0, 1])
+                self.assertEqual([row["corpus_frequency"] for row in rows], [0.0, 0.0])
+                self.assertEqual([row["core_frequency"] for row in rows], [0.0, 0.0])
+                self.assertEqual([row["ratio"] for row in rows], [None, None])
+                for order in ORDERINGS:
+                    self.assertEqual(sorted(words.order(order)), [0, 1])
+
+    def test_frequencies(self, lemma_metadata):
+        rows = vocabulary("1", 10000, 1000).rows([0, 1])
+        self.assertEqual([row["corpus_frequency"] for row in rows], [3.0, 1.0])
+        self.assertEqual([row["core_frequency"] for row in rows], [20.0, 0.0])
+        self.assertEqual([row["work_frequency"] for row in rows], [7500.0, 2500.0])
@@ -8,10 +8,13 @@ from django.contrib import admin
 
 from .views import (
     editions_list,
+    lemma_autocomplete,
+    lemma_bulk_json,
     lemma_detail,
     lemma_json,
     lemma_list,
     reader_redirect,
+    vocabulary_cache_stats,
     word_list,
 )
 
@@ -25,12 +28,17 @@ urlpatterns = [
     url(r"^oidc/", include("mozilla_django_oidc.urls")),
 
     url(r"^lemma/$", lemma_list, name="lemma_list"),
+    url(r"^lemma/list/(?P<response_format>json)/$", lemma_list, name="lemma_list_json"),
+    url(r"^lemma/autocomplete/json/$", lemma_autocomplete, name="lemma_autocomplete"),
     url(r"^lemma/(?P<pk>\d+)/$", lemma_detail, name="lemma_detail"),
     url(r"^lemma/json/", lemma_json, name="lemma_json"),
+    url(r"^lemma/bulk/json/$", lemma_bulk_json, name="lemma_bulk_json"),
 
     url(r"^editions/$", editions_list, name="editions_list"),
     url(r"^word-list/(?P<cts_urn>[^/]+)/$", word_list, name="word_list"),
-    url(r"^word-list/(?P<cts_urn>[^/]+)/(?P<response_format>json)/$", word_list, name="word_list_json"),
+    url(r"^word-list/(?P<cts_urn>[^/]+)/(?P<response_format>json|csv|ndjson)/$", word_list, name="word_list_json"),
+
+    url(r"^stats/vocabulary-cache/json/$", vocabulary_cache_stats, name="vocabulary_cache_stats"),
 
     url(r"^rr/(?P<cts_urn>[^/]+)/$", reader_redirect, name="reader_redirect"),
 
@@ -1,3 +1,4 @@
+import os
 import re
 import unicodedata
 
@@ -8,6 +9,10 @@ from pyuca.collator import Collator
 
 collator = Collator()
 
+# the last code point, which sorts after any character of a lemma form or a
+# passage key, so every string starting with s sorts before s + AFTER_ALL
+AFTER_ALL = "\U0010ffff"
+
 
 def strip_accents(s):
     return "".join(
@@ -16,12 +21,49 @@ def strip_accents(s):
     )
 
 
+def unaccent(s):
+    s = strip_accents(s).lower()
+    if s[-1] in "12345":
+        s = s[:-1]
+    return s
+
+
 def chunker(iterable, n):
     args = [iter(iterable)] * n
     for chunk in zip_longest(*args, fillvalue=None):
         yield [item for item in chunk if item is not None]
 
 
+def byte_ranges(filename, n):
+    """
+    Split `filename` into at most `n` contiguous (start, end) byte ranges
+    that begin and end on line boundaries.
+    """
+    size = os.path.getsize(filename)
+    bounds = [0]
+    with open(filename, "rb") as f:
+        for i in range(1, n):
+            f.seek(size * i // n)
+            f.readline()
+            pos = f.tell()
+            if bounds[-1] < pos < size:
+                bounds.append(pos)
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def read_byte_range(filename, start, end):
+    with open(filename, "rb") as f:
+        f.seek(start)
+        pos = start
+        while pos < end:
+            line = f.readline()
+            if not line:
+                break
+            pos += len(line)
+            yield line.decode("utf-8")
+
+
 def pg_array_format(iterable):
     return "{{{0}}}".format(",".join([f"\"{x}\"" for x in iterable]))
 
@@ -42,6 +84,25 @@ def natural_sort_key(ref, depth):
     return tuple(map(key, next(zip_longest(*([iter(tree)] * depth)))))
 
 
+def ref_range_keys(ref, depth=4):
+    """
+    The natural sort keys of the start and end of `ref`, a single (possibly
+    partial) reference or a `start-end` range, each without its missing
+    levels, or None if `ref` is malformed.
+    """
+    if "-" in ref:
+        start, end = ref.split("-", 1)
+    else:
+        start = end = ref
+    keys = []
+    for part in [start, end]:
+        levels = part.split(".")
+        if "-" in part or len(levels) > depth or not all(levels):
+            return None
+        keys.append(tuple(natural_sort_key_item(level) for level in levels))
+    return tuple(keys)
+
+
 def sort_key(s):
     return " ".join(
         str(n).zfill(5)
@@ -49,6 +110,13 @@ def sort_key(s):
     )
 
 
+def lemma_keys(text):
+    """
+    Return the (unaccented, sort_key) pair stored on a Lemma for `text`.
+    """
+    return unaccent(text), sort_key(text)
+
+
 def encode_link_header(lo: dict):
     links = []
     for rel, attrs in lo.items():
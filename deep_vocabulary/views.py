@@ -1,26 +1,108 @@
-from operator import itemgetter
+import csv
+import json
+from collections import OrderedDict
+from functools import wraps
+from itertools import chain
+from hashlib import md5
 from urllib.parse import urlencode
 
 from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
 from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator, Page
 from django.core.urlresolvers import reverse
-from django.db.models import Q, Sum
-from django.http import JsonResponse, Http404
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-
-from .models import (Definition, Lemma, PassageLemma, TextEdition,
-                     calc_overall_counts)
-from .querysets import Q_by_ref
-from .utils import encode_link_header, strip_accents
-
-
-def lemma_list(request):
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_POST
+
+from .engine import corpus_matrix, use_matrix
+from .models import (Lemma, TextEdition, calc_overall_counts,
+                     current_corpus_stats, lemma_shortdefs)
+from .pagination import KeysetPage, keyset_page
+from .search import FUZZY_MATCHES, lemma_index, search_lemmas
+from .utils import encode_link_header
+from .vocabulary import edition_vocabulary, vocabulary_cache
+
+
+# the most distinct lemmas one bulk lookup may ask for
+BULK_LOOKUP_LIMIT = 5000
+
+# the columns of a CSV word list, and the rows built at a time when
+# streaming one
+EXPORT_FIELDS = [
+    "lemma_id", "lemma_text", "shortdef", "count", "frequency", "work_count",
+    "work_frequency", "corpus_frequency", "core_frequency", "ratio",
+]
+EXPORT_CHUNK_SIZE = 1000
+
+
+def corpus_cached(json=False):
+    """
+    Serve a view whose output only changes when the corpus is rebuilt with
+    an ETag derived from the corpus version, answering conditional GETs
+    with a 304 before the view runs, and let browsers and proxies keep the
+    response for CORPUS_CACHE_MAX_AGE seconds.
+
+    HTML pages also carry the account bar and a CSRF token, so their ETag
+    depends on the user and CSRF cookie, and only the browser that asked
+    for one may keep it. Only the other formats are cached publicly.
+    """
+
+    def decorator(view):
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            page = not json and kwargs.get("response_format", "html") == "html"
+
+            def etag(request, *args, **kwargs):
+                etag = f"corpus-{current_corpus_stats().version}"
+                if page:
+                    visitor = f"{request.user.pk}:{request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')}"
+                    etag += "-" + md5(visitor.encode()).hexdigest()[:16]
+                return etag
+
+            response = condition(etag_func=etag)(view)(request, *args, **kwargs)
+            if response.status_code in [200, 304]:
+                if page:
+                    patch_cache_control(response, private=True, max_age=settings.CORPUS_CACHE_MAX_AGE)
+                    patch_vary_headers(response, ["Cookie"])
+                else:
+                    patch_cache_control(response, public=True, max_age=settings.CORPUS_CACHE_MAX_AGE)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def definition_source(request):
+    """
+    The dictionary source whose shortdefs a request asks for with ?source=,
+    if it is one of DEFINITION_SOURCES, or else DEFAULT_DEFINITION_SOURCE.
+    """
+    source = request.GET.get("source")
+    return source if source in settings.DEFINITION_SOURCES else settings.DEFAULT_DEFINITION_SOURCE
+
+
+def set_shortdefs(lemmas, source):
+    """
+    Replace the shortdef of each of `lemmas`, which is from
+    DEFAULT_DEFINITION_SOURCE, with its shortdef from `source`.
+    """
+    if source != settings.DEFAULT_DEFINITION_SOURCE:
+        shortdefs = lemma_shortdefs([lemma.pk for lemma in lemmas], source)
+        for lemma in lemmas:
+            lemma.shortdef = shortdefs.get(lemma.pk)
+
+
+def lemma_list(request, response_format="html"):
 
     query = request.GET.get("q")
     order = request.GET.get("o")
     scope = request.GET.get("scope")
     freqrange = request.GET.get("freqrange")
-    page = request.GET.get("page")
 
     if freqrange:
         try:
@@ -38,16 +120,11 @@ def lemma_list(request):
         mintick = None
         maxtick = None
 
+    fuzzy = bool(query and request.GET.get("fuzzy"))
     if query:
-        query = strip_accents(query).lower()
-        if query.startswith("*"):
-            lemma_list = Lemma.objects.filter(unaccented__endswith=query[1:])
-        elif query.endswith("*"):
-            lemma_list = Lemma.objects.filter(unaccented__startswith=query[:-1])
-        else:
-            lemma_list = Lemma.objects.filter(Q(unaccented=query)|(Q(definitions__shortdef__icontains=query)))
+        lemma_list = search_lemmas(query, fuzzy=fuzzy)
     else:
-        lemma_list = Lemma.objects
+        lemma_list = Lemma.objects.all()
 
     corpus_total, core_total = calc_overall_counts()
 
@@ -66,27 +143,36 @@ def lemma_list(request):
             maxcount = [None, 0.1, 0.2, 0.5, 1, 2, 5, 10, None][maxtick] * corpus_total / 10000
             lemma_list = lemma_list.filter(corpus_count__lte=maxcount)
 
-    lemma_list = lemma_list.order_by({
+    ordering = {
         "-1": "-sort_key",
         "1": "sort_key",
         "-2": "-core_count",
         "2": "core_count",
         "-3": "-corpus_count",
         "3": "corpus_count",
-    }.get(order, "-core_count"))
-
-    lemma_count = lemma_list.count()
+    }.get(order, "-core_count")
 
-    lemma_list = lemma_list.prefetch_related("definitions")
+    lemma_count = cached_count(lemma_list)
 
-    paginator = Paginator(lemma_list, 20)
+    if fuzzy and not order:
+        # the closest matches first, all on one page
+        lemmas = KeysetPage(
+            list(lemma_list.order_by("fuzzy_rank")),
+            0, lemma_count, FUZZY_MATCHES, "sort_key",
+        )
+    else:
+        lemmas = keyset_page(
+            lemma_list,
+            ordering,
+            lemma_count,
+            after=request.GET.get("after"),
+            before=request.GET.get("before"),
+            last=bool(request.GET.get("last")),
+        )
+    set_shortdefs(lemmas.object_list, definition_source(request))
 
-    try:
-        lemmas = paginator.page(page)
-    except PageNotAnInteger:
-        lemmas = paginator.page(1)
-    except EmptyPage:
-        lemmas = paginator.page(paginator.num_pages)
+    if response_format == "json":
+        return lemma_page_json(request, lemmas, lemma_count)
 
     return render(request, "deep_vocabulary/lemma_list.html", {
         "lemmas": lemmas,
@@ -96,6 +182,64 @@ def lemma_list(request):
     })
 
 
+def lemma_data(lemma, totals):
+    corpus_frequency, core_frequency = lemma.frequencies(totals)
+    return {
+        "id": lemma.pk,
+        "text": lemma.text,
+        "shortdef": lemma.shortdef,
+        "corpus_count": lemma.corpus_count,
+        "core_count": lemma.core_count,
+        "corpus_frequency": corpus_frequency,
+        "core_frequency": core_frequency,
+    }
+
+
+def lemma_page_json(request, lemmas, lemma_count):
+    totals = calc_overall_counts()
+    data = {
+        "lemmas": [
+            lemma_data(lemma, totals)
+            for lemma in lemmas
+        ],
+        "lemma_count": lemma_count,
+        "start_index": lemmas.start_index(),
+        "end_index": lemmas.end_index(),
+        "next": lemmas.next_cursor(),
+        "prev": lemmas.previous_cursor(),
+    }
+    links = {}
+    self_url = request.build_absolute_uri(reverse("lemma_list_json", kwargs={"response_format": "json"}))
+    params = request.GET.dict()
+    for param in ["after", "before", "last"]:
+        params.pop(param, None)
+    if data["prev"]:
+        links["prev"] = {"target": f"{self_url}?{urlencode({**params, 'before': data['prev']})}"}
+    if data["next"]:
+        links["next"] = {"target": f"{self_url}?{urlencode({**params, 'after': data['next']})}"}
+    response = JsonResponse(data)
+    if links:
+        response["Link"] = encode_link_header(links)
+    return response
+
+
+def cached_count(queryset):
+    """
+    The number of rows in `queryset`, cached per corpus version.
+    """
+    try:
+        sql = str(queryset.query)
+    except EmptyResultSet:
+        # a queryset that can match nothing has no SQL
+        return 0
+    key = "count:" + md5(f"{current_corpus_stats().version}:{sql}".encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, None)
+    return count
+
+
 def editions_list(request):
     core = "core" in request.GET
 
@@ -117,20 +261,28 @@ def editions_list(request):
     })
 
 
+@corpus_cached()
 def lemma_detail(request, pk):
     lemma = get_object_or_404(Lemma, pk=pk)
     filt = request.GET.get("filter")
 
     if filt:
-        passages = lemma.passages.filter(text_edition__cts_urn=filt).select_related().order_by_ref()
+        passages = lemma.passages.filter(
+            text_edition__cts_urn=filt
+        ).select_related("passage__text_edition").order_by_ref()
         filtered_edition = TextEdition.objects.filter(cts_urn=filt).first()
     else:
         passages = lemma.passages.all()
         filtered_edition = None
 
-    lemma_counts_per_edition = dict(
-        lemma.passages.values_list("text_edition").annotate(total=Sum("count")),
-    )
+    if use_matrix():
+        lemma_counts_per_edition = dict(zip(*[
+            column.tolist() for column in corpus_matrix().lemma_column(lemma.pk)
+        ]))
+    else:
+        lemma_counts_per_edition = dict(
+            lemma.editions.values_list("text_edition", "count"),
+        )
 
     corpus_freq, core_freq = lemma.frequencies()
 
@@ -164,6 +316,7 @@ def lemma_detail(request, pk):
     })
 
 
+@corpus_cached()
 def word_list(request, cts_urn, response_format="html"):
 
     # @@@ could use library for this but this will do for now
@@ -196,160 +349,22 @@ def word_list(request, cts_urn, response_format="html"):
 
     text_edition = get_object_or_404(TextEdition, cts_urn=edition_urn)
 
-    corpus_total, core_total = calc_overall_counts()
-
-    # @@@ remove this duplication with lemma_list
-    if freqrange:
-        try:
-            mintick, maxtick = freqrange.split(",")
-            mintick = int(mintick)
-            if mintick in [0, 8]:
-                mintick = None
-            maxtick = int(maxtick)
-            if maxtick in [0, 8]:
-                maxtick = None
-        except ValueError:
-            mintick = None
-            maxtick = None
-    else:
-        mintick = None
-        maxtick = None
-
-    if ref:
-        if "-" in ref:
-            start, end = ref.split("-")
-            ref_filter = Q_by_ref(start, "gte") & Q_by_ref(end, "lte")
-        else:
-            ref_filter = Q_by_ref(ref)
-    else:
-        ref_filter = Q()
-
-    # @@@ try to reduce duplication here with lemma_list
-    freq_filter = Q()
-    if scope == "core":
-        if mintick:
-            mincount = [None, 0.1, 0.2, 0.5, 1, 2, 5, 10, None][mintick] * core_total / 10000
-            freq_filter &= Q(lemma__core_count__gte=mincount)
-        if maxtick:
-            maxcount = [None, 0.1, 0.2, 0.5, 1, 2, 5, 10, None][maxtick] * core_total / 10000
-            freq_filter &= Q(lemma__core_count__lte=maxcount)
-    elif scope == "corpus":
-        if mintick:
-            mincount = [None, 0.1, 0.2, 0.5, 1, 2, 5, 10, None][mintick] * corpus_total / 10000
-            freq_filter &= Q(lemma__corpus_count__gte=mincount)
-        if maxtick:
-            maxcount = [None, 0.1, 0.2, 0.5, 1, 2, 5, 10, None][maxtick] * corpus_total / 10000
-            freq_filter &= Q(lemma__corpus_count__lte=maxcount)
-
-    if ref:
-        work_lemmas = dict(
-            PassageLemma.objects.filter(
-                Q(text_edition=text_edition),
-                freq_filter,
-            ).values_list("lemma").annotate(total=Sum("count"))
-        )
-    else:
-        work_lemmas = {}
-    passage_lemmas = dict(
-        PassageLemma.objects.filter(
-            Q(text_edition=text_edition),
-            ref_filter,
-            freq_filter,
-        ).values_list("lemma").annotate(total=Sum("count"))
-    )
-    definitions = dict(
-        Definition.objects.filter(
-            source="logeion_003",
-            lemma__in=passage_lemmas.keys()
-        ).values_list(
-            "lemma_id",
-            "shortdef"
-        ),
-    )
-    lemma_values_list = Lemma.objects.filter(
-        pk__in=passage_lemmas.keys()
-    ).values_list(
-        "pk", "text", "corpus_count", "core_count", "sort_key",
-    )
-    lemma_data = {item[0]: item[1:] for item in lemma_values_list}
-    total = sum(passage_lemmas.values())
-    work_total = sum(work_lemmas.values())
-    corpus_total, core_total = calc_overall_counts()
-
-    if order == "1":  # text (by sort_key)
-        sort_key = itemgetter("sort_key")
-        sort_reverse = False
-    elif order == "-1":  # text (by sort_key)
-        sort_key = itemgetter("sort_key")
-        sort_reverse = True
-    elif order == "2":  # core count ascending
-        sort_key = itemgetter("core_frequency")
-        sort_reverse = False
-    elif order == "-2":  # core count descending
-        sort_key = itemgetter("core_frequency")
-        sort_reverse = True
-    elif order == "3":  # corpus count ascending
-        sort_key = itemgetter("corpus_frequency")
-        sort_reverse = False
-    elif order == "-3":  # corpus count descending
-        sort_key = itemgetter("corpus_frequency")
-        sort_reverse = True
-    elif ref and order == "6":  # work count ascending
-        sort_key = itemgetter("work_frequency")
-        sort_reverse = False
-    elif ref and order == "-6":  # work count descending
-        sort_key = itemgetter("work_frequency")
-        sort_reverse = True
-    elif order == "4":  # log ratio ascending
-        sort_key = lambda x: x["ratio"] if x["ratio"] else 1  # noqa: E731
-        sort_reverse = False
-    elif order == "-4":  # log ratio descending
-        sort_key = lambda x: x["ratio"] if x["ratio"] else 1  # noqa: E731
-        sort_reverse = True
-    elif order == "5":  # count ascending
-        sort_key = itemgetter("count")
-        sort_reverse = False
-    else:  # usually "-5" but also default: count descending
-        sort_key = itemgetter("count")
-        sort_reverse = True
-
-    vocabulary = sorted(
-        [
-            {
-                "lemma_id": lemma_id,
-                "lemma_text": lemma_data[lemma_id][0],
-                "sort_key": lemma_data[lemma_id][3],
-                "shortdef": definitions[lemma_id],
-                "count": passage_lemmas[lemma_id],
-                "frequency": round(10000 * passage_lemmas[lemma_id] / total, 1),
-                "work_count": work_lemmas[lemma_id] if ref else None,
-                "work_frequency": round(10000 * work_lemmas[lemma_id] / work_total, 2) if ref else None,
-                "corpus_frequency": round(10000 * lemma_data[lemma_id][1] / corpus_total, 3),
-                "core_frequency": round(10000 * lemma_data[lemma_id][2] / core_total, 2),
-                "ratio": (
-                    (passage_lemmas[lemma_id] / total) / (lemma_data[lemma_id][2] / core_total)
-                ) if (not ref and lemma_data[lemma_id][2] != 0 and passage_lemmas[lemma_id] > 1) else None,
-            }
-            for lemma_id in passage_lemmas.keys()
-        ],
-        key=sort_key,
-        reverse=sort_reverse,
-    )
+    vocabulary = edition_vocabulary(text_edition, ref, scope, freqrange)
+    total = vocabulary.total
+    work_total = vocabulary.work_total
+    positions = vocabulary.order(order)
 
     lemma_count = len(vocabulary)
-    token_count = sum(lemma["count"] for lemma in vocabulary)
+    token_count = vocabulary.total
 
-    if page == "all":
-        lemmas = vocabulary
+    source = definition_source(request)
+    if response_format in ["csv", "ndjson"]:
+        return stream_word_list(vocabulary, positions, source, cts_urn, response_format)
+    elif page == "all":
+        lemmas = vocabulary.rows(positions, source)
     else:
-        paginator = Paginator(vocabulary, 20)
-
-        try:
-            lemmas = paginator.page(page)
-        except PageNotAnInteger:
-            lemmas = paginator.page(1)
-        except EmptyPage:
-            lemmas = paginator.page(paginator.num_pages)
+        lemmas = page_of(Paginator(positions, 20), page)
+        lemmas.object_list = vocabulary.rows(lemmas.object_list, source)
 
     # lemmas = vocabulary
 
@@ -401,20 +416,127 @@ def word_list(request, cts_urn, response_format="html"):
         return response
 
 
+def page_of(paginator, page):
+    """
+    The page numbered `page` of `paginator`, the first if `page` is not a
+    number and the last if it is past the end.
+    """
+    try:
+        return paginator.page(page)
+    except PageNotAnInteger:
+        return paginator.page(1)
+    except EmptyPage:
+        return paginator.page(paginator.num_pages)
+
+
+class Echo:
+    """
+    A file-like object for csv.writer that hands back each line written
+    rather than storing it, so rows can be streamed.
+    """
+
+    def write(self, value):
+        return value
+
+
+def stream_word_list(vocabulary, positions, source, cts_urn, response_format):
+    """
+    Stream every row of a word list as CSV (with a header row) or as one
+    JSON object per line, building EXPORT_CHUNK_SIZE rows at a time so
+    neither the first byte nor memory waits on the whole list.
+    """
+
+    def rows():
+        for start in range(0, len(positions), EXPORT_CHUNK_SIZE):
+            yield from vocabulary.rows(positions[start:start + EXPORT_CHUNK_SIZE], source)
+
+    if response_format == "csv":
+        writer = csv.writer(Echo())
+        response = StreamingHttpResponse(
+            chain(
+                [writer.writerow(EXPORT_FIELDS)],
+                (writer.writerow([row[field] for field in EXPORT_FIELDS]) for row in rows()),
+            ),
+            content_type="text/csv; charset=utf-8",
+        )
+        filename = cts_urn.replace(":", "_")
+        response["Content-Disposition"] = f'attachment; filename="{filename}.csv"'
+    else:
+        response = StreamingHttpResponse(
+            (json.dumps(row, ensure_ascii=False) + "\n" for row in rows()),
+            content_type="application/x-ndjson; charset=utf-8",
+        )
+    return response
+
+
+@corpus_cached(json=True)
 def lemma_json(request):
-    lemmas = request.GET.getlist("l")
+    lemmas = list(Lemma.objects.filter(text__in=request.GET.getlist("l")).order_by("sort_key"))
+    set_shortdefs(lemmas, definition_source(request))
     data = {
         "lemmas": [{
             "text": lemma.text,
-            "shortdef": getattr(lemma.definitions.first(), "shortdef"),
-        } for lemma in Lemma.objects.filter(
-            text__in=lemmas
-        ).order_by("sort_key")]
+            "shortdef": lemma.shortdef,
+        } for lemma in lemmas]
     }
     response = JsonResponse(data)
     return response
 
 
+@csrf_exempt
+@require_POST
+def lemma_bulk_json(request):
+    """
+    Look up many lemmas by text at once, given as a JSON body
+    `{"lemmas": [...]}` or as repeated `l` form fields, answering with
+    their counts, frequencies and shortdefs (from ?source=) in the order
+    asked for and the texts of any that were not found.
+    """
+    if request.content_type == "application/json":
+        try:
+            texts = json.loads(request.body.decode("utf-8"))["lemmas"]
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({"error": "expected a JSON object with a list of lemmas"}, status=400)
+    else:
+        texts = request.POST.getlist("l")
+    if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+        return JsonResponse({"error": "lemmas must be a list of strings"}, status=400)
+    texts = list(OrderedDict.fromkeys(texts))
+    if len(texts) > BULK_LOOKUP_LIMIT:
+        return JsonResponse({"error": f"at most {BULK_LOOKUP_LIMIT} lemmas can be looked up at once"}, status=400)
+
+    lemmas = {lemma.text: lemma for lemma in Lemma.objects.filter(text__in=texts)}
+    set_shortdefs(lemmas.values(), definition_source(request))
+    totals = calc_overall_counts()
+    return JsonResponse({
+        "lemmas": [
+            lemma_data(lemmas[text], totals)
+            for text in texts if text in lemmas
+        ],
+        "not_found": [text for text in texts if text not in lemmas],
+    })
+
+
+@corpus_cached(json=True)
+def lemma_autocomplete(request):
+    query = request.GET.get("q", "")
+    try:
+        limit = min(max(int(request.GET.get("limit", 10)), 1), 50)
+    except ValueError:
+        limit = 10
+    if not query.strip("*"):
+        return JsonResponse({"query": query, "lemmas": []})
+    index = lemma_index()
+    return JsonResponse({
+        "query": query,
+        "lemmas": index.rows(index.complete(query, limit)),
+    })
+
+
+def vocabulary_cache_stats(request):
+    return JsonResponse(vocabulary_cache.stats())
+
+
 def reader_redirect(request, cts_urn):
     SCAIFE_HOST = settings.SCAIFE_HOST
     if len(cts_urn.split(":")) == 4:
@@ -0,0 +1,447 @@
+import pickle
+import threading
+from collections import OrderedDict
+from hashlib import md5
+
+import numpy as np
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Q
+
+from .engine import corpus_matrix, passage_index, use_matrix
+from .models import (EditionLemma, Lemma, calc_overall_counts,
+                     current_corpus_stats, lemma_shortdefs,
+                     range_lemma_counts)
+
+
+FREQUENCY_TICKS = [None, 0.1, 0.2, 0.5, 1, 2, 5, 10, None]  # per 10k
+
+
+def parse_freqrange(freqrange):
+    """
+    Turn a "min,max" frequency range of slider ticks into (mintick, maxtick),
+    with None for an open end.
+    """
+    mintick = None
+    maxtick = None
+    if freqrange:
+        try:
+            mintick, maxtick = freqrange.split(",")
+            mintick = int(mintick)
+            if mintick in [0, 8]:
+                mintick = None
+            maxtick = int(maxtick)
+            if maxtick in [0, 8]:
+                maxtick = None
+        except ValueError:
+            mintick = None
+            maxtick = None
+    return mintick, maxtick
+
+
+def frequency_bounds(scope, mintick, maxtick):
+    """
+    The lemma count field ("core_count" or "corpus_count") and the
+    (inclusive) minimum and maximum counts selected by a frequency range,
+    with None for an open end, or None if nothing is filtered.
+    """
+    if scope not in ["core", "corpus"] or not (mintick or maxtick):
+        return None
+    corpus_total, core_total = calc_overall_counts()
+    total = core_total if scope == "core" else corpus_total
+    return (
+        f"{scope}_count",
+        FREQUENCY_TICKS[mintick] * total / 10000 if mintick else None,
+        FREQUENCY_TICKS[maxtick] * total / 10000 if maxtick else None,
+    )
+
+
+def filter_by_bounds(matrix, lemma_ids, counts, bounds):
+    """
+    The lemma ids and counts in the frequency band `bounds` (see
+    frequency_bounds), judged by the corpus matrix.
+    """
+    if bounds:
+        field, mincount, maxcount = bounds
+        columns = np.searchsorted(matrix.lemma_ids, lemma_ids)
+        lemma_counts = (matrix.core_counts if field == "core_count" else matrix.corpus_counts)[columns]
+        keep = np.ones(len(lemma_ids), dtype=bool)
+        if mincount is not None:
+            keep &= lemma_counts >= mincount
+        if maxcount is not None:
+            keep &= lemma_counts <= maxcount
+        lemma_ids, counts = lemma_ids[keep], counts[keep]
+    return lemma_ids, counts
+
+
+def matrix_edition_lemmas(text_edition, bounds):
+    """
+    The (lemma ids, counts) of a whole edition, in lemma id order, from the
+    in-memory corpus matrix.
+    """
+    matrix = corpus_matrix()
+    columns, counts = matrix.edition_row(text_edition.pk)
+    return filter_by_bounds(matrix, matrix.lemma_ids[columns], counts, bounds)
+
+
+def matrix_range_lemmas(text_edition, ordinals, bounds):
+    """
+    The (lemma ids, counts) over a run of passages, in lemma id order, from
+    the edition's in-memory passage index.
+    """
+    lemma_ids, counts = passage_index(text_edition.pk).range_counts(*ordinals)
+    return filter_by_bounds(corpus_matrix(), lemma_ids, counts, bounds)
+
+
+def lemma_metadata(lemma_ids, source):
+    """
+    The texts, sort keys and shortdefs from `source` of `lemma_ids`, as
+    lists in the same order, from the corpus snapshot if there is one.
+    """
+    matrix = corpus_matrix() if use_matrix() else None
+    if matrix and matrix.snapshot and f"lemma_shortdefs.{source}" in matrix.snapshot.string_names:
+        columns = np.searchsorted(matrix.lemma_ids, lemma_ids).tolist()
+        texts = matrix.snapshot.strings("lemma_texts")
+        sort_keys = matrix.snapshot.strings("lemma_sort_keys")
+        shortdefs = matrix.snapshot.strings(f"lemma_shortdefs.{source}")
+        return (
+            [texts[column] for column in columns],
+            [sort_keys[column] for column in columns],
+            [shortdefs[column] for column in columns],
+        )
+    lemmas = {
+        pk: (text, sort_key, shortdef)
+        for pk, text, sort_key, shortdef in Lemma.objects.filter(
+            pk__in=lemma_ids,
+        ).values_list("pk", "text", "sort_key", "shortdef")
+    }
+    if source == settings.DEFAULT_DEFINITION_SOURCE:
+        shortdefs = {pk: lemma[2] for pk, lemma in lemmas.items()}
+    else:
+        shortdefs = lemma_shortdefs(lemma_ids, source)
+    return (
+        [lemmas[pk][0] for pk in lemma_ids],
+        [lemmas[pk][1] for pk in lemma_ids],
+        [shortdefs.get(pk) for pk in lemma_ids],
+    )
+
+
+# o parameter: (sort field, descending)
+ORDERINGS = {
+    "1": ("sort_key", False),
+    "-1": ("sort_key", True),
+    "2": ("core_frequency", False),
+    "-2": ("core_frequency", True),
+    "3": ("corpus_frequency", False),
+    "-3": ("corpus_frequency", True),
+    "4": ("ratio", False),
+    "-4": ("ratio", True),
+    "5": ("count", False),
+    "-5": ("count", True),
+    "6": ("work_frequency", False),
+    "-6": ("work_frequency", True),
+}
+
+
+def per_10000(counts, total, digits):
+    """
+    `counts` per 10,000 of `total`, or zeros for a total with no tokens.
+    """
+    if not total:
+        return np.zeros(len(counts))
+    return np.round(10000 * counts / total, digits)
+
+
+class Vocabulary:
+    """
+    A word list as parallel arrays with one element per lemma: lemma ids,
+    counts (and counts in the whole work, for a range of passages), corpus
+    and core counts and rank by sort key.
+
+    Frequencies and ratios are computed over the whole arrays for sorting,
+    and a row dict for display is only built for the lemmas being shown.
+    """
+
+    def __init__(self, ref, lemma_ids, counts, work_counts, corpus_counts,
+                 core_counts, sort_ranks, work_total, corpus_total, core_total):
+        self.ref = ref
+        self.lemma_ids = lemma_ids
+        self.counts = counts
+        self.work_counts = work_counts
+        self.corpus_counts = corpus_counts
+        self.core_counts = core_counts
+        self.sort_ranks = sort_ranks
+        self.total = int(counts.sum())
+        self.work_total = work_total
+        self.corpus_total = corpus_total
+        self.core_total = core_total
+
+    def __len__(self):
+        return len(self.lemma_ids)
+
+    def sort_values(self, field):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if field == "sort_key":
+                return self.sort_ranks
+            if field == "core_frequency":
+                return per_10000(self.core_counts, self.core_total, 2)
+            if field == "corpus_frequency":
+                return per_10000(self.corpus_counts, self.corpus_total, 3)
+            if field == "work_frequency":
+                return per_10000(self.work_counts, self.work_total, 2)
+            if field == "ratio":
+                # lemmas without a ratio sort as if it were 1
+                if self.ref or not (self.total and self.core_total):
+                    return np.ones(len(self))
+                ratios = (self.counts / self.total) / (self.core_counts / self.core_total)
+                return np.where((self.core_counts != 0) & (self.counts > 1), ratios, 1)
+            return self.counts
+
+    def order(self, order):
+        """
+        The positions of the lemmas in the order given by the `o` parameter
+        (by default, descending count). Lemmas that sort equal keep their
+        relative order.
+        """
+        field, descending = ORDERINGS.get(order, ("count", True))
+        if field == "work_frequency" and not self.ref:
+            field, descending = "count", True
+        values = self.sort_values(field)
+        return np.argsort(-values if descending else values, kind="stable")
+
+    def rows(self, positions, source=None):
+        """
+        A dict for display for each lemma at `positions`, with its shortdef
+        from `source` (by default DEFAULT_DEFINITION_SOURCE).
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        lemma_ids = self.lemma_ids[positions].tolist()
+        texts, sort_keys, shortdefs = lemma_metadata(lemma_ids, source or settings.DEFAULT_DEFINITION_SOURCE)
+        counts = self.counts[positions].tolist()
+        corpus_counts = self.corpus_counts[positions].tolist()
+        core_counts = self.core_counts[positions].tolist()
+        work_counts = self.work_counts[positions].tolist() if self.ref else None
+        ref, total, work_total = self.ref, self.total, self.work_total
+        corpus_total, core_total = self.corpus_total, self.core_total
+        return [
+            {
+                "lemma_id": lemma_id,
+                "lemma_text": texts[i],
+                "sort_key": sort_keys[i],
+                "shortdef": shortdefs[i],
+                "count": counts[i],
+                "frequency": round(10000 * counts[i] / total, 1) if total else 0.0,
+                "work_count": work_counts[i] if ref else None,
+                "work_frequency": (
+                    round(10000 * work_counts[i] / work_total, 2) if work_total else 0.0
+                ) if ref else None,
+                "corpus_frequency": round(10000 * corpus_counts[i] / corpus_total, 3) if corpus_total else 0.0,
+                "core_frequency": round(10000 * core_counts[i] / core_total, 2) if core_total else 0.0,
+                "ratio": (
+                    (counts[i] / total) / (core_counts[i] / core_total)
+                ) if (not ref and core_counts[i] != 0 and counts[i] > 1 and core_total) else None,
+            }
+            for i, lemma_id in enumerate(lemma_ids)
+        ]
+
+
+def compute_vocabulary(text_edition, ref, ordinals, scope, mintick, maxtick):
+    """
+    The Vocabulary of `text_edition`, or of the passages with `ordinals`
+    when `ref` is given.
+    """
+    corpus_total, core_total = calc_overall_counts()
+    bounds = frequency_bounds(scope, mintick, maxtick)
+
+    if use_matrix():
+        matrix = corpus_matrix()
+        work_ids, work_counts = matrix_edition_lemmas(text_edition, bounds)
+        if not ref:
+            lemma_ids, counts = work_ids, work_counts
+        elif ordinals:
+            lemma_ids, counts = matrix_range_lemmas(text_edition, ordinals, bounds)
+        else:
+            lemma_ids, counts = work_ids[:0], work_counts[:0]
+        columns = np.searchsorted(matrix.lemma_ids, lemma_ids)
+        corpus_counts = matrix.corpus_counts[columns]
+        core_counts = matrix.core_counts[columns]
+        sort_ranks = matrix.sort_ranks[columns]
+    else:
+        work_ids, work_counts, lemma_ids, counts, corpus_counts, core_counts, sort_ranks = sql_vocabulary(
+            text_edition, ref, ordinals, bounds,
+        )
+
+    return Vocabulary(
+        ref,
+        lemma_ids,
+        counts,
+        work_counts[np.searchsorted(work_ids, lemma_ids)] if ref else None,
+        corpus_counts,
+        core_counts,
+        sort_ranks,
+        int(work_counts.sum()) if ref else 0,
+        corpus_total,
+        core_total,
+    )
+
+
+def sql_vocabulary(text_edition, ref, ordinals, bounds):
+    """
+    The arrays of a Vocabulary (see compute_vocabulary) from the database.
+    """
+    freq_filter = Q()
+    if bounds:
+        field, mincount, maxcount = bounds
+        if mincount is not None:
+            freq_filter &= Q(**{f"lemma__{field}__gte": mincount})
+        if maxcount is not None:
+            freq_filter &= Q(**{f"lemma__{field}__lte": maxcount})
+
+    edition_lemmas = sorted(
+        EditionLemma.objects.filter(
+            Q(text_edition=text_edition),
+            freq_filter,
+        ).values_list("lemma", "count")
+    )
+    if not ref:
+        passage_lemmas = edition_lemmas
+    elif ordinals:
+        passage_lemmas = sorted(
+            range_lemma_counts(text_edition, *ordinals, lemma_filter=freq_filter).items()
+        )
+    else:
+        passage_lemmas = []
+    work_ids, work_counts = np.array(edition_lemmas, dtype=np.int64).reshape(-1, 2).T
+    lemma_ids, counts = np.array(passage_lemmas, dtype=np.int64).reshape(-1, 2).T
+
+    lemmas = {
+        pk: (corpus_count, core_count, sort_key)
+        for pk, corpus_count, core_count, sort_key in Lemma.objects.filter(
+            pk__in=lemma_ids.tolist(),
+        ).values_list("pk", "corpus_count", "core_count", "sort_key")
+    }
+    lemmas = [lemmas[pk] for pk in lemma_ids.tolist()]
+    sort_ranks = np.empty(len(lemma_ids), dtype=np.int64)
+    sort_ranks[np.argsort(np.array([lemma[2] for lemma in lemmas], dtype=str), kind="stable")] = np.arange(len(lemma_ids))
+    return (
+        work_ids,
+        work_counts,
+        lemma_ids,
+        counts,
+        np.array([lemma[0] for lemma in lemmas], dtype=np.int64),
+        np.array([lemma[1] for lemma in lemmas], dtype=np.int64),
+        sort_ranks,
+    )
+
+
+class VocabularyCache:
+    """
+    A least-recently-used cache of computed vocabularies, bounded by the
+    (pickled) size of its entries rather than their number.
+
+    If `shared` names a cache alias (such as a memcached or Redis cache in
+    CACHES) it is consulted on a local miss and filled on every computation,
+    so processes can reuse each other's work.
+    """
+
+    def __init__(self, max_bytes, shared=None):
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, compute):
+        """
+        Return the value cached under `key`, calling `compute()` to create
+        it on a miss.
+        """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+
+        shared = caches[self.shared] if self.shared else None
+        shared_key = "vocabulary:" + md5(repr(key).encode()).hexdigest()
+        value = shared.get(shared_key) if shared else None
+        if value is not None:
+            self.shared_hits += 1
+        else:
+            value = compute()
+            self.misses += 1
+            if shared:
+                shared.set(shared_key, value, None)
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+vocabulary_cache = VocabularyCache(
+    settings.VOCABULARY_CACHE_MAX_BYTES,
+    shared=settings.VOCABULARY_CACHE_ALIAS,
+)
+
+
+def edition_vocabulary(text_edition, ref, scope, freqrange):
+    """
+    The vocabulary of `text_edition`, or of the passages `ref` in it, with
+    the frequency filter given by `scope` and `freqrange`, through the
+    vocabulary cache. Entries are keyed by corpus version, so a rebuild
+    never serves vocabularies computed from the previous corpus.
+    """
+    mintick, maxtick = parse_freqrange(freqrange)
+    if scope not in ["core", "corpus"] or not (mintick or maxtick):
+        scope, mintick, maxtick = None, None, None
+    if not ref:
+        ordinals = None
+    elif use_matrix():
+        ordinals = passage_index(text_edition.pk).ordinal_range(ref)
+    else:
+        ordinals = text_edition.passages.ordinal_range(ref)
+    key = (
+        current_corpus_stats().version,
+        text_edition.cts_urn,
+        ordinals if ref else "all",
+        scope,
+        mintick,
+        maxtick,
+    )
+    return vocabulary_cache.get(
+        key,
+        lambda: compute_vocabulary(text_edition, ref, ordinals, scope, mintick, maxtick),
+    )
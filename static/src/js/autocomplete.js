@@ -0,0 +1,74 @@
+// Suggestions are listed in a dropdown of our own rather than a <datalist>,
+// which browsers filter against the typed text: an unaccented or `*suffix`
+// query would hide every (accented) suggestion.
+const hookupLemmaAutocomplete = () => {
+  $('input[data-autocomplete-url]').each((index, input) => {
+    const $input = $(input);
+    const $list = $input.siblings('.lemma-completions');
+    let timer = null;
+    let request = null;
+
+    const close = () => {
+      $list.removeClass('show').empty();
+    };
+
+    const choose = (text) => {
+      $input.val(text);
+      close();
+      $input.closest('form').submit();
+    };
+
+    $input.on('input', () => {
+      clearTimeout(timer);
+      timer = setTimeout(() => {
+        if (request) {
+          request.abort();
+        }
+        const q = $input.val();
+        if (q.replace(/\*/g, '').length === 0) {
+          close();
+          return;
+        }
+        request = $.getJSON($input.data('autocomplete-url'), { q }, (data) => {
+          close();
+          data.lemmas.forEach((lemma) => {
+            $list.append($('<button type="button" class="dropdown-item">').text(lemma.text));
+          });
+          $list.toggleClass('show', data.lemmas.length > 0);
+        });
+      }, 100);
+    });
+
+    $input.on('keydown', (event) => {
+      const $items = $list.children();
+      const active = $items.index($items.filter('.active'));
+      if (event.key === 'ArrowDown' || event.key === 'ArrowUp') {
+        if ($items.length) {
+          event.preventDefault();
+          const step = event.key === 'ArrowDown' ? 1 : -1;
+          let next = (active + step + $items.length) % $items.length;
+          if (active < 0) {
+            next = step > 0 ? 0 : $items.length - 1;
+          }
+          $items.removeClass('active');
+          $items.eq(next).addClass('active');
+        }
+      } else if (event.key === 'Enter' && active >= 0) {
+        event.preventDefault();
+        choose($items.eq(active).text());
+      } else if (event.key === 'Escape') {
+        close();
+      }
+    });
+
+    // mousedown rather than click, which would come after the input's blur
+    $list.on('mousedown', '.dropdown-item', (event) => {
+      event.preventDefault();
+      choose($(event.currentTarget).text());
+    });
+
+    $input.on('blur', close);
+  });
+};
+
+export default hookupLemmaAutocomplete;
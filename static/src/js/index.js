@@ -10,6 +10,7 @@ import ajaxSendMethod from './ajax';
 import handleMessageDismiss from './messages';
 import loadStripeElements from './pinax-stripe';
 import hookupCustomFileWidget from './pinax-documents';
+import hookupLemmaAutocomplete from './autocomplete';
 
 $(() => {
     $(document).ajaxSend(ajaxSendMethod);
@@ -40,4 +41,5 @@ $(() => {
     handleMessageDismiss();
     loadStripeElements();
     hookupCustomFileWidget();
+    hookupLemmaAutocomplete();
 });